@@ -0,0 +1,125 @@
+"""
+Micro-benchmarks for the hot paths in image_handler.py and the vault scan.
+
+Usage:
+    python benchmark.py            # run every benchmark
+    python benchmark.py alpha      # run selected benchmarks by name
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+from image_handler import ImageHandler
+
+
+def _measure(func, repeat):
+    """Median wall time of `repeat` runs, in milliseconds."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def _report(label, baseline_ms, candidate_ms):
+    speedup = baseline_ms / candidate_ms if candidate_ms else float('inf')
+    print(f"  {label:<28} before {baseline_ms:8.2f} ms   after {candidate_ms:8.2f} ms   x{speedup:5.1f}")
+
+
+def _make_handler(tmp_dir):
+    return ImageHandler(tmp_dir, 'Bench', {'async_processing': False})
+
+
+def bench_alpha(repeat=7, size=(2560, 1440)):
+    """Flattening RGBA/P screenshots: always-composite (old) vs opaque-alpha fast path."""
+    from PIL import Image
+
+    def legacy_flatten(img, bg_rgb):
+        background = Image.new('RGB', img.size, bg_rgb)
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+
+    opaque = Image.effect_noise(size, 64).convert('RGBA')
+    transparent = opaque.copy()
+    transparent.putalpha(Image.linear_gradient('L').resize(size))
+    palette = opaque.convert('RGB').quantize(64)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        handler = _make_handler(tmp_dir)
+        print(f"alpha: flatten {size[0]}x{size[1]} to RGB (median of {repeat})")
+        for label, img in (("opaque RGBA", opaque), ("transparent RGBA", transparent), ("P without transparency", palette)):
+            before = _measure(lambda: legacy_flatten(img, (255, 255, 255)), repeat)
+            after = _measure(lambda: handler._flatten_to_rgb(img, (255, 255, 255)), repeat)
+            _report(label, before, after)
+
+
+def _make_vault(root, notes, top_folders=20, depth=3):
+    """Synthetic vault: `notes` notes spread over nested folders, plus .trash and Templates."""
+    import os
+
+    folders = []
+    for i in range(top_folders):
+        path = os.path.join(root, f'Area {i}')
+        for level in range(depth):
+            folders.append(path)
+            path = os.path.join(path, f'Level {level}')
+    folders += [os.path.join(root, name) for name in ('.trash', 'Templates', '.obsidian')]
+    for folder in folders:
+        os.makedirs(folder, exist_ok=True)
+    for n in range(notes):
+        with open(os.path.join(folders[n % len(folders)], f'Note {n}.md'), 'w') as f:
+            f.write('x')
+
+
+def bench_vault_scan(repeat=5, sizes=(2000, 20000)):
+    """Finding the latest note: os.walk + Path + double stat (old) vs pruned parallel scandir."""
+    import os
+    from pathlib import Path
+    from path_rules import NoteScanRules
+
+    def legacy_latest(vault):
+        md_files = []
+        for root, dirs, files in os.walk(vault):
+            dirs[:] = [d for d in dirs if d not in {'.git', '.obsidian'}]
+            for file in files:
+                if file.endswith('.md'):
+                    if file.endswith('.excalidraw.md'):
+                        continue
+                    md_files.append(Path(root) / file)
+        latest = max(md_files, key=lambda x: x.stat().st_mtime)
+        return latest, latest.stat().st_mtime
+
+    rules = NoteScanRules.from_options({'note_scan_rules': 'Templates/'})
+    for notes in sizes:
+        with tempfile.TemporaryDirectory() as vault:
+            _make_vault(vault, notes)
+            print(f"vault_scan: latest of {notes} notes (median of {repeat})")
+            before = _measure(lambda: legacy_latest(vault), repeat)
+            _report("sequential scandir", before, _measure(lambda: rules.recent_notes(vault, max_workers=1), repeat))
+            _report("parallel scandir", before, _measure(lambda: rules.recent_notes(vault), repeat))
+            _report("parallel scandir, top 10", before, _measure(lambda: rules.recent_notes(vault, k=10), repeat))
+
+
+BENCHMARKS = {
+    'alpha': bench_alpha,
+    'vault_scan': bench_vault_scan,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image_handler hot paths")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,200 @@
+import json
+import threading
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ControlServer:
+    """
+    Local HTTP API for scripts and capture tools, bound to 127.0.0.1 only:
+
+      GET  /status    running flag, queue depth, per-lane waits and per-stage timings
+      GET  /history   recently added images (?limit=N, default 20)
+      GET  /metrics   counters and gauges in the Prometheus text format
+      POST /start     start monitoring with the current settings
+      POST /stop      stop monitoring
+      POST /submit    {"path": "..."} or {"paths": [...]}: queue images without waiting for the watcher
+
+    POST bodies must be sent as application/json, which a web page cannot do cross-origin without
+    a preflight, and requests naming another Host are refused (DNS rebinding), so browsers cannot
+    drive the API. Start and stop run on the Tk thread.
+    """
+
+    def __init__(self, app, port, host='127.0.0.1', log_callback=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.log_callback = log_callback
+        self._server = None
+        self._thread = None
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), _ControlRequestHandler)
+        self._server.daemon_threads = True
+        self._server.control = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='control-server', daemon=True)
+        self._thread.start()
+        self.log(f"Control API listening on http://{self.host}:{self._server.server_address[1]}", "INFO")
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _on_ui(self, action, timeout=30):
+        """Run action() on the Tk thread and return its result."""
+        done = threading.Event()
+        result = {}
+
+        def run():
+            try:
+                result['value'] = action()
+            except Exception as e:
+                result['error'] = e
+            finally:
+                done.set()
+
+        self.app.root.after(0, run)
+        if not done.wait(timeout):
+            raise TimeoutError("the app did not respond")
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    # --- endpoints ------------------------------------------------------------------------
+
+    def status(self):
+        app = self.app
+        scheduler = app.scheduler
+        status = {'running': app.is_running, 'queue': {}, 'lanes': {}, 'stages': {}}
+        if scheduler is not None:
+            status['queue'] = scheduler.queue_depth()
+            status['lanes'] = scheduler.lane_stats()
+            status['stages'] = scheduler.stage_timings.snapshot()
+        return status
+
+    def history(self, limit=20):
+        handler = self.app.handler
+        items = list(handler.history[:limit]) if handler is not None else []
+        return [{
+            'image_code': item['image_code'],
+            'path': str(item['current_path']),
+            'original_path': str(item['original_path']),
+            'note': str(item['note_path']),
+            'variants': {name: str(path) for name, path in (item.get('variants') or {}).items()},
+            'timestamp': item.get('timestamp'),
+        } for item in items]
+
+    def start_monitoring(self):
+        if not self.app.is_running:
+            self._on_ui(self.app.start_monitoring)
+        return {'running': self.app.is_running}
+
+    def stop_monitoring(self):
+        if self.app.is_running:
+            self._on_ui(self.app.stop_monitoring)
+        return {'running': self.app.is_running}
+
+    def submit(self, paths):
+        """Queue each path on the route watching it; returns one result per path."""
+        dispatcher = self.app.dispatcher
+        results = []
+        for path in paths:
+            path = Path(path)
+            route = dispatcher.route_for(str(path)) if dispatcher is not None else None
+            if dispatcher is None:
+                result = 'not running'
+            elif not path.is_file():
+                result = 'not found'
+            elif route is None:
+                result = 'not in a watched folder'
+            elif not route.handler.is_image_file(path):
+                result = 'not an image'
+            elif not route.handler.recent_files.is_new(path):
+                result = 'already seen'
+            else:
+                route.handler.submit(path)
+                result = 'queued'
+            results.append({'path': str(path), 'result': result})
+        return results
+
+
+class _ControlRequestHandler(BaseHTTPRequestHandler):
+    server_version = 'ImageProcessorControl/1.0'
+    LOCAL_HOSTS = ('127.0.0.1', 'localhost')
+
+    def log_request(self, code='-', size='-'):
+        pass  # only errors go to the app log
+
+    def log_message(self, format, *args):
+        self.server.control.log(f"Control API: {format % args}", "WARNING")
+
+    def _local_host(self):
+        host = self.headers.get('Host', '').rsplit(':', 1)[0]
+        if host in self.LOCAL_HOSTS:
+            return True
+        self._reply(403, {'error': "requests must be addressed to localhost"})
+        return False
+
+    def _reply(self, status, payload, content_type='application/json'):
+        body = (payload if isinstance(payload, str) else json.dumps(payload)).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._local_host():
+            return
+        control = self.server.control
+        url = urlparse(self.path)
+        try:
+            if url.path == '/status':
+                self._reply(200, control.status())
+            elif url.path == '/history':
+                limit = int(parse_qs(url.query).get('limit', ['20'])[0])
+                self._reply(200, control.history(max(0, limit)))
+            elif url.path == '/metrics':
+                self._reply(200, control.app.metrics.render(), 'text/plain; version=0.0.4; charset=utf-8')
+            else:
+                self._reply(404, {'error': f"unknown endpoint {url.path}"})
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+
+    def do_POST(self):
+        if not self._local_host():
+            return
+        control = self.server.control
+        url = urlparse(self.path)
+        if self.headers.get('Content-Type', '').split(';')[0].strip() != 'application/json':
+            self._reply(415, {'error': "send the request body as application/json"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            if not isinstance(body, dict):
+                raise ValueError("the request body must be a JSON object")
+            if url.path == '/start':
+                self._reply(200, control.start_monitoring())
+            elif url.path == '/stop':
+                self._reply(200, control.stop_monitoring())
+            elif url.path == '/submit':
+                paths = body.get('paths') or ([body['path']] if body.get('path') else [])
+                if not isinstance(paths, list) or not paths or not all(isinstance(path, str) for path in paths):
+                    raise ValueError('expected {"path": "..."} or {"paths": [...]}')
+                self._reply(200, {'results': control.submit(paths)})
+            else:
+                self._reply(404, {'error': f"unknown endpoint {url.path}"})
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
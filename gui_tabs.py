@@ -1,6 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
 
+from thumbnail_cache import ThumbnailCache, PhotoImageLRU
+
 
 class MainSettingsTab:
     def __init__(self, parent, settings, theme):
@@ -76,6 +78,33 @@ class MainSettingsTab:
                   command=lambda: self.browse_folder('images_folder'),
                   style='Modern.TButton').pack(side="right")
         
+        # Subfolder watching row
+        subfolders_row = tk.Frame(paths_content, bg=self.theme.colors['bg_primary'])
+        subfolders_row.pack(fill="x", pady=(10, 0))
+        
+        tk.Label(subfolders_row, text="Subfolder depth:", 
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                font=('Segoe UI', 10)).pack(side="left")
+        
+        ttk.Spinbox(subfolders_row, from_=0, to=10, increment=1,
+                   textvariable=self.settings['watch_depth'], width=4,
+                   font=('Segoe UI', 10), style='Modern.TSpinbox').pack(side="left", padx=(5, 15))
+        
+        tk.Label(subfolders_row, text="Ignore:", 
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                font=('Segoe UI', 10)).pack(side="left")
+        
+        ttk.Entry(subfolders_row, textvariable=self.settings['watch_ignore'],
+                 font=('Segoe UI', 10), style='Modern.TEntry').pack(side="left", fill="x", expand=True, padx=(5, 0))
+        
+        ttk.Checkbutton(paths_content, text="📁 Use subfolder name as prefix",
+                       variable=self.settings['subfolder_prefix_enabled'],
+                       style='Modern.TCheckbutton').pack(anchor="w", pady=(5, 0))
+        
+        tk.Label(paths_content, text="💡 Depth 0 watches only the folder itself; ignore takes comma-separated globs",
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_secondary'],
+                font=('Segoe UI', 9)).pack(anchor="w")
+        
         # Prefix Settings Card
         prefix_card = self.theme.create_card_frame(horizontal_container, "🏷️ Prefix Settings")
         prefix_card.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
@@ -173,6 +202,24 @@ class MainSettingsTab:
                    textvariable=self.settings['cooldown'], width=5,
                    font=('Segoe UI', 10), style='Modern.TSpinbox').pack(anchor="w")
         
+        queue_row = tk.Frame(basic_content, bg=self.theme.colors['bg_primary'])
+        queue_row.pack(fill="x", pady=(5, 5))
+        
+        tk.Label(queue_row, text="📥 Queue Limit / When Full:", 
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                font=('Segoe UI', 10, 'bold')).pack(anchor="w", pady=(0, 5))
+        
+        queue_input = tk.Frame(queue_row, bg=self.theme.colors['bg_primary'])
+        queue_input.pack(fill="x")
+        
+        ttk.Spinbox(queue_input, from_=10, to=100000, increment=50,
+                   textvariable=self.settings['queue_limit'], width=7,
+                   font=('Segoe UI', 10), style='Modern.TSpinbox').pack(side="left", padx=(0, 10))
+        
+        ttk.Combobox(queue_input, textvariable=self.settings['overload_policy'],
+                    values=('spill', 'block', 'drop_oldest'), state="readonly", width=12,
+                    font=('Segoe UI', 10)).pack(side="left")
+        
         # Processing Options Card
         options_card = self.theme.create_card_frame(options_container, "🔄 Processing Options")
         options_card.grid(row=0, column=1, sticky="nsew", padx=(5, 0))
@@ -192,6 +239,9 @@ class MainSettingsTab:
         ttk.Checkbutton(options_content, text="🔢 Auto-numbering", 
                        variable=self.settings['auto_numbering'],
                        style='Modern.TCheckbutton').pack(anchor="w", pady=3)
+        ttk.Checkbutton(options_content, text="🌐 Number across all notes",
+                       variable=self.settings['global_numbering'],
+                       style='Modern.TCheckbutton').pack(anchor="w", pady=3)
         
         # Pack canvas and scrollbar
         canvas.pack(side="left", fill="both", expand=True)
@@ -317,7 +367,69 @@ class ImageProcessingTab:
 
         ttk.Button(color_input, text="🎨 Choose Color", command=self.choose_color,
                   style='Modern.TButton').pack(side="left")
-        
+
+        # Memory ceiling for very large images
+        memory_frame = tk.Frame(options_content, bg=self.theme.colors['bg_primary'])
+        memory_frame.pack(fill="x", pady=(10, 0))
+
+        tk.Label(memory_frame, text="Memory ceiling for large images (MB):",
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                font=('Segoe UI', 10, 'bold')).pack(anchor="w", pady=(0, 8))
+
+        memory_input = tk.Frame(memory_frame, bg=self.theme.colors['bg_primary'])
+        memory_input.pack(fill="x")
+
+        ttk.Spinbox(memory_input, from_=64, to=16384, increment=64,
+                   textvariable=self.settings['max_image_memory_mb'], width=7,
+                   font=('Segoe UI', 10), style='Modern.TSpinbox').pack(side="left", padx=(0, 10))
+
+        ttk.Combobox(memory_input, textvariable=self.settings['oversize_policy'],
+                    values=('downscale', 'reject'), state="readonly", width=12,
+                    font=('Segoe UI', 10)).pack(side="left")
+
+        # Animated GIF/WebP handling
+        animated_frame = tk.Frame(options_content, bg=self.theme.colors['bg_primary'])
+        animated_frame.pack(fill="x", pady=(10, 0))
+
+        tk.Label(animated_frame, text="Animated images:",
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                font=('Segoe UI', 10, 'bold')).pack(side="left", padx=(0, 10))
+
+        ttk.Combobox(animated_frame, textvariable=self.settings['animated_policy'],
+                    values=('keep', 'webp', 'flatten'), state="readonly", width=12,
+                    font=('Segoe UI', 10)).pack(side="left")
+
+        # Extra Renditions Card (full width)
+        variants_card = self.theme.create_card_frame(scrollable_frame, "🗂️ Extra Renditions")
+        variants_card.pack(fill="x", padx=5, pady=(0, 15))
+
+        variants_content = tk.Frame(variants_card, bg=self.theme.colors['bg_primary'])
+        variants_content.pack(fill="x", padx=20, pady=(10, 20))
+
+        variant_rows = [
+            ("🔍 Small preview", 'preview_enabled', 'preview_max_size', 'preview_folder'),
+            ("🌐 Web version", 'web_variant_enabled', 'web_max_size', 'web_folder'),
+        ]
+        for row, (label, enabled_key, size_key, folder_key) in enumerate(variant_rows):
+            ttk.Checkbutton(variants_content, text=label,
+                           variable=self.settings[enabled_key],
+                           style='Modern.TCheckbutton').grid(row=row, column=0, sticky="w", pady=3)
+            tk.Label(variants_content, text="Max size (px):",
+                    bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                    font=('Segoe UI', 10)).grid(row=row, column=1, sticky="w", padx=(15, 5))
+            ttk.Spinbox(variants_content, from_=32, to=8192, increment=32,
+                       textvariable=self.settings[size_key], width=6,
+                       font=('Segoe UI', 10), style='Modern.TSpinbox').grid(row=row, column=2, sticky="w")
+            tk.Label(variants_content, text="Folder:",
+                    bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                    font=('Segoe UI', 10)).grid(row=row, column=3, sticky="w", padx=(15, 5))
+            ttk.Entry(variants_content, textvariable=self.settings[folder_key], width=20,
+                     font=('Segoe UI', 10), style='Modern.TEntry').grid(row=row, column=4, sticky="w")
+
+        tk.Label(variants_content, text="Renditions are written from the same decoded image and named like the main file (e.g. Game_3.jpg)",
+                bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_secondary'],
+                font=('Segoe UI', 9)).grid(row=len(variant_rows), column=0, columnspan=5, sticky="w", pady=(8, 0))
+
         # Pack canvas and scrollbar
         canvas.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -371,6 +483,27 @@ class NoteProcessingTab:
                        variable=self.settings['skip_excalidraw'],
                        style='Modern.TCheckbutton').pack(anchor="w", pady=3)
 
+        rules_row = tk.Frame(search_content, bg=self.theme.colors['bg_primary'])
+        rules_row.pack(anchor="w", pady=3)
+        tk.Label(rules_row, text="Exclude:", 
+                 bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                 font=('Segoe UI', 10)).pack(side="left", padx=(0, 5))
+        ttk.Entry(rules_row, textvariable=self.settings['note_scan_rules'], width=30,
+                 font=('Segoe UI', 10), style='Modern.TEntry').pack(side="left")
+        tk.Label(rules_row, text="(gitignore-style, comma-separated, ! re-includes)", 
+                 font=("Segoe UI", 9), fg="gray", bg=self.theme.colors['bg_primary']).pack(side="left", padx=5)
+
+        resolver_row = tk.Frame(search_content, bg=self.theme.colors['bg_primary'])
+        resolver_row.pack(anchor="w", pady=3)
+        tk.Label(resolver_row, text="Target note:", 
+                 bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_primary'],
+                 font=('Segoe UI', 10)).pack(side="left", padx=(0, 5))
+        ttk.Combobox(resolver_row, textvariable=self.settings['note_resolver'],
+                    values=('workspace', 'mtime'), state="readonly", width=12,
+                    font=('Segoe UI', 10)).pack(side="left")
+        tk.Label(resolver_row, text="(workspace = note open in Obsidian, mtime = last modified)", 
+                 font=("Segoe UI", 9), fg="gray", bg=self.theme.colors['bg_primary']).pack(side="left", padx=5)
+
         # Image Format Settings Card (right)
         format_card = self.theme.create_card_frame(horizontal_top, "🖼️ Image Format Settings")
         format_card.grid(row=0, column=1, sticky="nsew", padx=(5, 0), pady=(0, 5))
@@ -557,9 +690,17 @@ Note: Override Prefix will ignore the $prefix= command above."""
 
 
 class RecentImagesTab:
+    ROW_THUMB_SIZE = 48
+    PREVIEW_SIZE = 320
+
     def __init__(self, parent, app, theme):
         self.app = app
         self.theme = theme
+        self.thumbnails = ThumbnailCache()
+        self.photo_cache = PhotoImageLRU()  # limit applied from settings when photos are added
+        self._row_keys = {}  # tree iid -> (source path, mtime, size) of the thumbnail shown in that row
+        self._visible_job = None
+        self._preview_key = None
         self.setup_ui(parent)
         
     def setup_ui(self, parent):
@@ -586,20 +727,40 @@ class RecentImagesTab:
         list_content = tk.Frame(list_frame, bg=self.theme.colors['bg_primary'])
         list_content.pack(fill="both", expand=True, padx=10, pady=10)
         
-        # Treeview for columns
+        # Preview pane (right)
+        preview_frame = tk.Frame(list_content, bg=self.theme.colors['bg_primary'],
+                                 width=self.PREVIEW_SIZE + 20)
+        preview_frame.pack(side="right", fill="y", padx=(10, 0))
+        preview_frame.pack_propagate(False)
+
+        self.preview_label = tk.Label(preview_frame, text="No image selected",
+                                      bg=self.theme.colors['bg_primary'], fg=self.theme.colors['text_secondary'],
+                                      font=('Segoe UI', 9), compound="top")
+        self.preview_label.pack(fill="both", expand=True)
+
+        # Treeview for columns (tree column #0 holds the row thumbnail)
+        style = ttk.Style()
+        style.configure('Recent.Treeview', rowheight=self.ROW_THUMB_SIZE + 6)
+
         columns = ("filename", "time", "note")
-        self.tree = ttk.Treeview(list_content, columns=columns, show="headings", selectmode="browse")
+        self.tree = ttk.Treeview(list_content, columns=columns, show="tree headings", selectmode="browse",
+                                 style='Recent.Treeview')
         
         self.tree.heading("filename", text="Filename")
         self.tree.heading("time", text="Time")
         self.tree.heading("note", text="Added To")
         
+        self.tree.column("#0", width=self.ROW_THUMB_SIZE + 16, stretch=False)
         self.tree.column("filename", width=200)
         self.tree.column("time", width=100)
         self.tree.column("note", width=150)
         
         scrollbar = ttk.Scrollbar(list_content, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+
+        def on_tree_scroll(first, last):
+            scrollbar.set(first, last)
+            self._schedule_visible_thumbnails()
+        self.tree.configure(yscrollcommand=on_tree_scroll)
         
         self.tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
@@ -647,6 +808,7 @@ class RecentImagesTab:
         # Clear current
         for item in self.tree.get_children():
             self.tree.delete(item)
+        self._row_keys.clear()
             
         if not self.app.handler:
             self.status_label.config(text="Monitoring not running - history unavailable", fg="orange")
@@ -662,6 +824,95 @@ class RecentImagesTab:
             self.tree.insert("", "end", iid=str(i), values=(fname, t_str, note))
             
         self.status_label.config(text=f"Loaded {len(self.app.handler.history)} items", fg="green")
+        self._schedule_visible_thumbnails()
+
+    def _thumbnail_source(self, item):
+        """Prefer the small preview rendition when one was written, it renders much faster."""
+        preview = item.get('variants', {}).get('preview')
+        if preview and preview.exists():
+            return preview
+        return item['current_path']
+
+    @staticmethod
+    def _thumbnail_key(source_path, size):
+        """PhotoImage cache key; includes the mtime so a replaced file is not shown stale."""
+        try:
+            mtime = source_path.stat().st_mtime_ns
+        except OSError:
+            mtime = 0
+        return source_path, mtime, size
+
+    def _schedule_visible_thumbnails(self):
+        """Debounce thumbnail loading while the list is being scrolled."""
+        if self._visible_job is not None:
+            self.tree.after_cancel(self._visible_job)
+        self._visible_job = self.tree.after(50, self._load_visible_thumbnails)
+
+    def _load_visible_thumbnails(self):
+        """Decode thumbnails only for rows currently on screen."""
+        self._visible_job = None
+        if not self.app.handler:
+            return
+        history = self.app.handler.history
+        for iid in self.tree.get_children():
+            if not self.tree.bbox(iid):
+                continue  # row is scrolled out of view
+            index = int(iid)
+            if index >= len(history):
+                continue
+            key = self._thumbnail_key(self._thumbnail_source(history[index]), self.ROW_THUMB_SIZE)
+            self._row_keys[iid] = key
+            self._show_thumbnail(key, lambda photo, iid=iid, key=key: self._set_row_image(iid, key, photo))
+
+    def _show_thumbnail(self, key, apply):
+        """Apply a cached PhotoImage now, or render it off the Tk thread and apply when ready."""
+        photo = self.photo_cache.get(key)
+        if photo is not None:
+            apply(photo)
+            return
+        source_path, _, size = key
+        self._poll_thumbnail(self.thumbnails.request(source_path, size), key, apply)
+
+    def _poll_thumbnail(self, future, key, apply):
+        """Wait for a render on the Tk thread (Tk must not be called from the pool's threads)."""
+        if not future.done():
+            self.tree.after(30, self._poll_thumbnail, future, key, apply)
+            return
+        if future.cancelled() or future.exception() is not None:
+            return  # pool shut down, or the render failed
+        self._on_thumbnail_ready(key, future.result(), apply)
+
+    def _on_thumbnail_ready(self, key, thumb_path, apply):
+        if thumb_path is None:
+            return
+        try:
+            photo = tk.PhotoImage(file=str(thumb_path))
+        except tk.TclError:
+            return
+        self.photo_cache.max_bytes = self.app.settings['thumbnail_memory_mb'].get() * 1024 * 1024
+        for evicted in self.photo_cache.put(key, photo):
+            for iid, row_key in self._row_keys.items():
+                if row_key == evicted and self.tree.exists(iid):
+                    self.tree.item(iid, image='')
+        apply(photo)
+
+    def _set_row_image(self, iid, key, photo):
+        # The list may have been refreshed while the thumbnail was rendering
+        if self._row_keys.get(iid) == key and self.tree.exists(iid):
+            self.tree.item(iid, image=photo)
+
+    def _show_preview(self, item):
+        # The pane is larger than the preview rendition, so render from the image itself
+        source_path = item['current_path']
+        key = self._thumbnail_key(source_path, self.PREVIEW_SIZE)
+        self._preview_key = key
+        self.preview_label.config(image='', text=f"Loading {source_path.name}...")
+
+        def apply(photo):
+            if self._preview_key == key:
+                self.preview_label.config(image=photo, text=source_path.name)
+                self.preview_label.image = photo  # keep shown photo alive even if the LRU evicts it
+        self._show_thumbnail(key, apply)
         
     def on_select(self, event):
         """Populate fields on selection"""
@@ -675,6 +926,7 @@ class RecentImagesTab:
             self.current_name_var.set(item['current_path'].name)
             self.new_name_var.set(item['current_path'].stem) # Pre-fill with current stem
             self.apply_btn.config(state="normal")
+            self._show_preview(item)
             
     def apply_rename(self):
         """Execute rename"""
@@ -693,8 +945,11 @@ class RecentImagesTab:
              self.status_label.config(text="Handler not running", fg="red")
              return
              
-        # Call backend
-        success, msg = self.app.handler.rename_recent_item(index, new_stem)
+        # Call backend (history is shared across routes; each entry is renamed by the handler that made it)
+        handler = self.app.handler
+        if index < len(handler.history):
+            handler = handler.history[index].get('handler', handler)
+        success, msg = handler.rename_recent_item(index, new_stem)
         
         if success:
             self.status_label.config(text=msg, fg="green")
@@ -1,5 +1,6 @@
 import os
 import re
+import mmap
 import time
 import logging
 from pathlib import Path
@@ -8,9 +9,16 @@ import mimetypes
 import threading
 import queue
 
+from path_rules import RecentFiles
+from note_resolver import create_note_resolver
+from note_cache import NoteState, NoteStateCache
+from work_scheduler import RetryQueue, NoteWriter, StageTimings
+from metrics import Metrics
+
 
 class ImageHandler(FileSystemEventHandler):
-    def __init__(self, obsidian_vault_path, default_prefix, options, log_callback=None, clipboard_callback=None):
+    def __init__(self, obsidian_vault_path, default_prefix, options, log_callback=None, clipboard_callback=None,
+                 scheduler=None):
         self.obsidian_vault_path = Path(obsidian_vault_path)
         self.default_prefix = default_prefix
         self.options = options
@@ -18,27 +26,50 @@ class ImageHandler(FileSystemEventHandler):
         self.cooldown_seconds = options.get('cooldown', 2.0)
         self.log_callback = log_callback
         self.clipboard_callback = clipboard_callback
+        # Counters for the metrics export, shared through the scheduler
+        self.metrics = scheduler.metrics if scheduler is not None else Metrics()
         
         # Performance optimizations
-        self._cached_note_path = None
-        self._cached_note_mtime = 0
-        self._note_cache_valid = False
-        self._cached_note_content = None
-        self._cached_note_content_mtime = 0
+        self.note_resolver = create_note_resolver(self.obsidian_vault_path, options, log_callback=self.log,
+                                                  metrics=self.metrics)
+        # Parsed note state (content, commands, numbering) for the notes used most recently
+        self.note_states = NoteStateCache(max_bytes=options.get('note_cache_mb', 8) * 1024 * 1024,
+                                          max_entries=options.get('note_cache_entries', 32))
         
         # Pre-compile regex patterns for better performance
         self._compiled_patterns = self._compile_regex_patterns()
+        self._image_code_bytes = re.compile(self._compiled_patterns['image_code'].pattern.encode())
+        
+        self._local_lock = threading.RLock()  # re-entrant: note and folder keys share it without a scheduler
         
         # History tracking for Recent Images feature
         self.history = []
         self.history_callback = None  # Optional callback when history changes
+
+        # Optional vault-wide VaultLinkIndex (set by the app) used for reference-aware renames
+        self.link_index = None
+
+        # Duplicate-event filter; the app shares one across routes so no route picks up another's output
+        self.recent_files = RecentFiles(options.get('dedup_ttl', 10))
+
+        # Optional NumberingRegistry of the images folder (set by the app), for global_numbering
+        self.numbering = None
         
         # Setup logging
         self.logger = logging.getLogger(__name__)
         
-        # Async / worker
+        # Async / worker (a shared WorkScheduler replaces the per-handler thread when routing)
+        self.scheduler = scheduler
+        # Steps that hit a locked file are retried later; names they allocated stay reserved
+        self.retries = scheduler.retries if scheduler is not None else RetryQueue(log_callback=self.log)
+        self._reserved_paths = set()
+        # Time spent per processing stage, for the status API and the shutdown summary
+        self.stage_timings = scheduler.stage_timings if scheduler is not None else StageTimings()
+        # Appends for a burst of images into one note are combined into one write
+        self.note_writer = NoteWriter(self._write_held, self.options.get('append_batch_ms', 250) / 1000,
+                                      log_callback=self.log)
         self.async_enabled = self.options.get('async_processing', True)
-        if self.async_enabled:
+        if self.async_enabled and scheduler is None:
             self._work_queue = queue.Queue()
             self._worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
             self._worker_thread.start()
@@ -81,10 +112,19 @@ class ImageHandler(FileSystemEventHandler):
             'image_code': re.compile(r'\[\[File:(.+?)_(\d+)\.[^|\]]+(?:\|[^\]]+)?\]\]')
         }
         
+    # Settings the note resolver (and its compiled scan rules) is built from
+    NOTE_RESOLVER_KEYS = ('note_resolver', 'note_scan_rules', 'skip_excalidraw', 'recursive')
+
     def update_options(self, new_options):
         """Update options dynamically without restarting"""
+        resolver_options = [self.options.get(key) for key in self.NOTE_RESOLVER_KEYS]
         self.options.update(new_options)
         self.cooldown_seconds = self.options.get('cooldown', 2.0)
+        self.note_states.max_bytes = self.options.get('note_cache_mb', 8) * 1024 * 1024
+        self.note_states.max_entries = self.options.get('note_cache_entries', 32)
+        if [self.options.get(key) for key in self.NOTE_RESOLVER_KEYS] != resolver_options:
+            self.note_resolver = create_note_resolver(self.obsidian_vault_path, self.options, log_callback=self.log,
+                                                      metrics=self.metrics)
         
     def log(self, message, level="INFO"):
         """Custom log method that sends to GUI"""
@@ -108,16 +148,28 @@ class ImageHandler(FileSystemEventHandler):
     def create_subprefix_from_filename(self, note_path):
         """Create a subprefix from the note filename by removing non-alphanumeric chars and capitalizing words"""
         filename = note_path.stem  # Get filename without extension
-        
+        subprefix = self._camel_case(filename)
+        return subprefix if subprefix else "Untitled"
 
+    @staticmethod
+    def _camel_case(text):
+        """'good vibrations-2' -> 'GoodVibrations2'"""
         # Replace non-alphanumeric with spaces, then split
-        cleaned = ''.join(c if c.isalnum() else ' ' for c in filename)
+        cleaned = ''.join(c if c.isalnum() else ' ' for c in text)
         words = cleaned.split()
         
         # Capitalize each word and join them
-        subprefix = ''.join(word.capitalize() for word in words if word)
-        
-        return subprefix if subprefix else "Untitled"
+        return ''.join(word.capitalize() for word in words if word)
+
+    def get_subfolder_prefix(self, image_path):
+        """Prefix from the subfolder an image landed in, or None if it is directly in the watched folder"""
+        images_folder = self.options.get('images_folder')
+        if not images_folder or not image_path:
+            return None
+        parent = Path(image_path).parent
+        if os.path.normcase(os.path.abspath(parent)) == os.path.normcase(os.path.abspath(images_folder)):
+            return None
+        return self._camel_case(parent.name) or None
         
     def build_automatic_prefix(self, note_path):
         """Build automatic prefix from user prefix and note filename"""
@@ -158,33 +210,52 @@ class ImageHandler(FileSystemEventHandler):
                 self.process_image(path)
             except Exception as e:
                 self.log(f"Worker error: {e}", "ERROR")
+                self.metrics.inc('errors_total', stage='process')
             finally:
                 self._work_queue.task_done()
 
     def on_created(self, event):
         if event.is_directory:
             return
-            
-        # Check cooldown
-        current_time = time.time()
-        if current_time - self.last_processed_time < self.cooldown_seconds:
-            self.log(f"Cooldown active, ignoring {event.src_path}", "INFO")
+        self._on_new_file(Path(str(event.src_path)))
+
+    def on_moved(self, event):
+        # Savers that write a temporary file and rename it into place only produce a move
+        if event.is_directory:
             return
-            
-        file_path = Path(str(event.src_path))
-        
+        self._on_new_file(Path(str(event.dest_path)))
+
+    def _on_new_file(self, file_path):
         # Check if it's an image file
         if not self.is_image_file(file_path):
             return
+
+        # Repeated events for the same file, and files this app wrote or renamed itself
+        if not self.recent_files.is_new(file_path):
+            self.log(f"Ignoring {file_path.name}: already seen or written by this app", "DEBUG")
+            return
+
+        # Check cooldown
+        current_time = time.time()
+        if current_time - self.last_processed_time < self.cooldown_seconds:
+            self.log(f"Cooldown active, ignoring {file_path}", "INFO")
+            return
             
         self.last_processed_time = current_time
-        if self.async_enabled:
+        self.submit(file_path)
+
+    def submit(self, file_path):
+        """Queue an image (shared scheduler or own worker), or process it right away when not async."""
+        if self.async_enabled and self.scheduler is not None:
+            self.scheduler.submit(self, file_path)
+        elif self.async_enabled:
             self._work_queue.put(file_path)
         else:
             try:
                 self.process_image(file_path)
             except Exception as e:
                 self.log(f"Error processing {file_path}: {str(e)}", "ERROR")
+                self.metrics.inc('errors_total', stage='process')
 
     def _attempt_pillow_probe(self, path):
         """Fast probe to see if file is already a valid image."""
@@ -297,8 +368,327 @@ class ImageHandler(FileSystemEventHandler):
         # Final existence check (better to try than to block further)
         return path.exists()
 
-    def convert_to_jpg(self, image_path, note_commands=None):
-        """Convert image to JPG format if it's not already JPG. Returns (final_path, converted_bool)."""
+    def _variant_specs(self):
+        """
+        Enabled extra renditions as (name, max_size, folder, quality) tuples,
+        largest first so each one can be downscaled from the previous one.
+        """
+        specs = []
+        if self.options.get('web_variant_enabled', False):
+            specs.append(('web', int(self.options.get('web_max_size', 1600)),
+                          self.options.get('web_folder', 'web'), int(self.options.get('web_quality', 85))))
+        if self.options.get('preview_enabled', False):
+            specs.append(('preview', int(self.options.get('preview_max_size', 320)),
+                          self.options.get('preview_folder', '_previews'), int(self.options.get('preview_quality', 80))))
+        specs.sort(key=lambda spec: spec[1], reverse=True)
+        return specs
+
+    def _render_variants(self, img, variants):
+        """
+        Downscale an already decoded image into every enabled rendition (in memory).
+        Each rendition is resized from the previous (larger) one instead of the full-size image.
+        Transparent sources (conversion off) are composited onto bg_color like converted images.
+        """
+        from PIL import Image
+        if img.mode in self.FLATTEN_MODES:
+            source = self._flatten_to_rgb(img, self._parse_bg_color(self.options.get('bg_color', '#FFFFFF')))
+        else:
+            source = img if img.mode == 'RGB' else img.convert('RGB')
+        for name, max_size, folder, quality in self._variant_specs():
+            scale = min(max_size / source.width, max_size / source.height, 1.0)
+            if scale < 1.0:
+                size = (max(1, round(source.width * scale)), max(1, round(source.height * scale)))
+                source = source.resize(size, Image.LANCZOS, reducing_gap=3.0)
+            elif source is img:
+                source = img.copy()  # small source: must outlive the caller closing img
+            variants[name] = (source, folder, quality)
+        return variants
+
+    def _save_variants(self, variants, image_path, stem):
+        """Write rendered variants as {stem}.jpg into their folders (relative to the image folder)."""
+        if variants is None:
+            return {}
+        if not variants:
+            # Nothing was rendered during conversion (e.g. source already JPG): decode once now
+            try:
+                from PIL import Image
+                largest = self._variant_specs()[0][1]
+                with Image.open(image_path) as img:
+                    img.draft('RGB', (largest, largest))  # JPEG: decode at reduced scale
+                    self._render_variants(img, variants)
+            except Exception as e:
+                self.log(f"Could not render variants for {image_path.name}: {e}", "WARNING")
+                return {}
+
+        saved = {}
+        for name, (variant, folder, quality) in variants.items():
+            folder_path = Path(folder)
+            if not folder_path.is_absolute():
+                folder_path = image_path.parent / folder_path
+            try:
+                folder_path.mkdir(parents=True, exist_ok=True)
+                variant_path = folder_path / f"{stem}.jpg"
+                variant.save(variant_path, 'JPEG', quality=quality, optimize=self.options.get('optimize_jpg', True))
+                saved[name] = variant_path
+                self.log(f"Saved {name} variant {variant_path.name} ({variant.width}x{variant.height})", "DEBUG")
+            except Exception as e:
+                self.log(f"Could not save {name} variant for {stem}: {e}", "WARNING")
+        return saved
+
+    def _flatten_to_rgb(self, img, bg_rgb):
+        """
+        Flatten an RGBA/LA/P image to RGB.
+        Only composites onto bg_rgb when the alpha band really contains transparency;
+        fully opaque screenshots take the much cheaper convert('RGB') path.
+        """
+        from PIL import Image
+        if img.mode == 'P':
+            if 'transparency' not in img.info:
+                return img.convert('RGB')
+            img = img.convert('RGBA')
+
+        alpha = img.getchannel('A')
+        if alpha.getextrema() == (255, 255):
+            return img.convert('RGB')
+
+        background = Image.new('RGB', img.size, bg_rgb)
+        background.paste(img, mask=alpha)
+        return background
+
+    FLATTEN_MODES = ('RGBA', 'LA', 'P')  # modes _flatten_to_rgb composites onto the background
+
+    @staticmethod
+    def _decoded_bytes_per_pixel(mode):
+        """Approximate in-memory size of one pixel once Pillow has decoded an image of this mode."""
+        if mode in ('1', 'L', 'P'):
+            return 1
+        if mode.startswith('I;16'):
+            return 2
+        return 4  # Pillow stores RGB, RGBA, LA, CMYK, I and F in 4 bytes per pixel
+
+    def _plan_conversion_memory(self, img, image_path):
+        """
+        Decide how to convert an opened (not yet decoded) image within the memory ceiling.
+        Returns (plan, reduce_factor) where plan is 'full', 'strips' or 'reject'.
+
+        The estimate is decoded source + RGB output (none for an RGB source, which is encoded
+        as decoded). Sources that need flattening and are above stream_threshold_mp are
+        flattened strip by strip so no second full-size RGBA/alpha copy is made.
+        """
+        width, height = img.size
+        pixels = width * height
+        ceiling = int(self.options.get('max_image_memory_mb', 1024)) * 1024 * 1024
+        source_bytes = pixels * self._decoded_bytes_per_pixel(img.mode)
+        output_bytes = 0 if img.mode == 'RGB' else pixels * 4
+        plan = 'strips' if img.mode in self.FLATTEN_MODES and self._is_large(pixels) else 'full'
+
+        if ceiling <= 0 or source_bytes + output_bytes <= ceiling:
+            return plan, 1
+
+        size_mb = (source_bytes + output_bytes) / (1024 * 1024)
+        if source_bytes >= ceiling:
+            self.log(f"Skipping conversion of {image_path.name}: {width}x{height} needs ~{size_mb:.0f} MB, "
+                     f"source alone exceeds the {ceiling // (1024 * 1024)} MB ceiling", "ERROR")
+            return 'reject', 1
+        if self.options.get('oversize_policy', 'downscale') != 'downscale':
+            self.log(f"Skipping conversion of {image_path.name}: {width}x{height} needs ~{size_mb:.0f} MB "
+                     f"(ceiling {ceiling // (1024 * 1024)} MB)", "ERROR")
+            return 'reject', 1
+
+        # Smallest integer reduction that makes source + reduced output fit
+        factor = 2
+        while source_bytes + output_bytes // (factor * factor) > ceiling:
+            factor += 1
+        self.log(f"{image_path.name} is {width}x{height} (~{size_mb:.0f} MB to convert), "
+                 f"downscaling by {factor}x to stay under the memory ceiling", "WARNING")
+        return 'full', factor
+
+    def _is_large(self, pixels):
+        return pixels > float(self.options.get('stream_threshold_mp', 24)) * 1_000_000
+
+    def _plan_animation_memory(self, img, image_path):
+        """
+        Reduce factor for transcoding every frame of an animation within the memory ceiling,
+        or None when oversize_policy rejects it. Each frame is held decoded and as RGBA (at most
+        4 bytes per pixel each) until the WebP is written.
+        """
+        width, height = img.size
+        frames = getattr(img, 'n_frames', 1)
+        ceiling = int(self.options.get('max_image_memory_mb', 1024)) * 1024 * 1024
+        needed = frames * width * height * 8
+        if ceiling <= 0 or needed <= ceiling:
+            return 1
+
+        size_mb = needed / (1024 * 1024)
+        if self.options.get('oversize_policy', 'downscale') != 'downscale':
+            self.log(f"Not transcoding {image_path.name}: {frames} frames of {width}x{height} need ~{size_mb:.0f} MB "
+                     f"(ceiling {ceiling // (1024 * 1024)} MB), keeping original format", "ERROR")
+            return None
+        factor = 2
+        while needed // (factor * factor) > ceiling:
+            factor += 1
+        self.log(f"{image_path.name} has {frames} frames of {width}x{height} (~{size_mb:.0f} MB to transcode), "
+                 f"downscaling by {factor}x to stay under the memory ceiling", "WARNING")
+        return factor
+
+    def _reduce_image(self, img, factor):
+        """Integer downscale; reduce() is a cheap box filter but doesn't support every mode."""
+        from PIL import Image
+        try:
+            return img.reduce(factor)
+        except ValueError:
+            return img.resize((max(1, img.width // factor), max(1, img.height // factor)), Image.NEAREST)
+
+    def _flatten_in_strips(self, img, bg_rgb):
+        """
+        Build the RGB output strip by strip, so peak memory is the decoded source,
+        the output and one strip instead of several full-size intermediate copies.
+        """
+        from PIL import Image
+        strip_rows = max(16, int(self.options.get('stream_strip_rows', 256)))
+        img.load()
+        output = Image.new('RGB', img.size, bg_rgb)
+        for top in range(0, img.height, strip_rows):
+            strip = img.crop((0, top, img.width, min(top + strip_rows, img.height)))
+            if strip.mode in self.FLATTEN_MODES:
+                strip = self._flatten_to_rgb(strip, bg_rgb)
+            elif strip.mode != 'RGB':
+                strip = strip.convert('RGB')
+            output.paste(strip, (0, top))
+        return output
+
+    ANIMATABLE_SUFFIXES = {'.gif', '.webp', '.png', '.apng', '.avif'}
+
+    def _is_animated(self, img, image_path):
+        """
+        Cheap animation check. Formats that can't animate never touch frame data;
+        for the rest, Pillow's is_animated only looks for a second frame instead of
+        counting them all like n_frames does.
+        """
+        if image_path.suffix.lower() not in self.ANIMATABLE_SUFFIXES:
+            return False
+        return bool(getattr(img, 'is_animated', False))
+
+    def _convert_animated(self, img, image_path, quality, bg_rgb, variants=None):
+        """
+        Handle an animated source according to animated_policy:
+          keep (default): leave the file as-is (no JPG, original not deleted)
+          webp: transcode to animated WebP
+          flatten: legacy behavior, only the first frame survives as JPG
+        Returns (final_path, converted_bool) like convert_to_jpg.
+        """
+        policy = self.options.get('animated_policy', 'keep')
+        if policy == 'flatten':
+            self.log(f"{image_path.name} is animated, flattening first frame to JPG", "WARNING")
+            jpg_path = image_path.with_suffix('.jpg')
+            self.recent_files.mark_own(jpg_path)
+            frame = self._flatten_to_rgb(img, bg_rgb) if img.mode in ('RGBA', 'LA', 'P') else img.convert('RGB')
+            frame.save(jpg_path, 'JPEG', quality=quality, optimize=self.options.get('optimize_jpg', True))
+            if variants is not None and self._variant_specs():
+                self._render_variants(frame, variants)
+            self._delete_original(image_path)
+            return jpg_path, True
+
+        if policy != 'webp' or image_path.suffix.lower() == '.webp':
+            self.log(f"{image_path.name} is animated, keeping original format", "INFO")
+            return image_path, False
+
+        from PIL import ImageSequence
+        from concurrent.futures import ThreadPoolExecutor
+
+        factor = self._plan_animation_memory(img, image_path)
+        if factor is None:
+            return image_path, False
+
+        self.log(f"Transcoding animated {image_path.name} to WebP", "INFO")
+        # Frames depend on their predecessors, so decoding is sequential; the per-frame
+        # RGBA conversion is independent and runs on a pool (Pillow releases the GIL there)
+        raw_frames, durations = [], []
+        for frame in ImageSequence.Iterator(img):
+            raw_frames.append(self._reduce_image(frame.convert('RGBA'), factor) if factor > 1 else frame.copy())
+            durations.append(frame.info.get('duration', img.info.get('duration', 100)))
+        workers = max(1, min(len(raw_frames), self.options.get('animated_workers', os.cpu_count() or 2)))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(lambda f: f if f.mode == 'RGBA' else f.convert('RGBA'), raw_frames))
+        del raw_frames
+
+        webp_path = image_path.with_suffix('.webp')
+        self.recent_files.mark_own(webp_path)
+        frames[0].save(
+            webp_path, 'WEBP', save_all=True, append_images=frames[1:],
+            duration=durations, loop=img.info.get('loop', 0),
+            quality=self.options.get('animated_webp_quality', 80),
+            method=self.options.get('animated_webp_method', 4),
+        )
+        self.log(f"Saved animated {webp_path.name} ({len(frames)} frames)", "INFO")
+        if variants is not None and self._variant_specs():
+            self._render_variants(self._flatten_to_rgb(frames[0], bg_rgb), variants)
+        self._delete_original(image_path)
+        return webp_path, True
+
+    def _delete_original(self, image_path):
+        if self.options.get('delete_original', True):
+            try:
+                image_path.unlink()
+                self.log(f"Deleted original file {image_path.name}", "DEBUG")
+            except PermissionError:
+                self.retries.schedule(f"Delete original {image_path.name}",
+                                      lambda: image_path.unlink(missing_ok=True),
+                                      max_age=self.options.get('retry_max_age', 120))
+            except Exception as e:
+                self.log(f"Could not delete original {image_path.name}: {e}", "WARNING")
+
+    def _parse_bg_color(self, bg_color):
+        """'#RRGGBB' or 'RRGGBB' -> (r, g, b); falls back to white."""
+        if not bg_color.startswith('#'):
+            bg_color = '#' + bg_color
+        try:
+            return tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5))
+        except ValueError:
+            self.log(f"Invalid bg color {bg_color}, using white", "WARNING")
+            return (255, 255, 255)
+
+    def _write_jpg(self, source, image_path, jpg_path, quality, bg_rgb, variants=None, keep_metadata=False):
+        """
+        Flatten an opened (still image) source and encode it to jpg_path within the memory ceiling.
+        Returns False if the image was rejected as too large. Shared by convert_to_jpg and the
+        bulk optimizer, which writes to a temporary path instead.
+        """
+        # Header-only check: decide how to decode before any pixels are loaded
+        plan, factor = self._plan_conversion_memory(source, image_path)
+        if plan == 'reject':
+            return False
+        metadata = {}
+        if keep_metadata:
+            metadata = {key: source.info[key] for key in ('exif', 'icc_profile') if source.info.get(key)}
+        img = source
+        if factor > 1:
+            img = self._reduce_image(img, factor)
+
+        if plan == 'strips':
+            img = self._flatten_in_strips(img, bg_rgb)
+        elif img.mode in self.FLATTEN_MODES:
+            img = self._flatten_to_rgb(img, bg_rgb)
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        if img is not source:
+            source.close()  # release the decoded source before the encoder allocates its buffers
+
+        # Huffman optimization buffers every DCT coefficient, so large images skip it
+        optimize = self.options.get('optimize_jpg', True) and not self._is_large(img.width * img.height)
+        img.save(jpg_path, 'JPEG', quality=quality, optimize=optimize, **metadata)
+
+        if variants is not None and self._variant_specs():
+            self._render_variants(img, variants)
+        return True
+
+    def convert_to_jpg(self, image_path, note_commands=None, variants=None):
+        """
+        Convert image to JPG format if it's not already JPG. Returns (final_path, converted_bool).
+        If a `variants` dict is given, the enabled renditions are rendered into it from the same
+        decoded image so they can be saved later under the final filename.
+        """
         convert_enabled = self.options.get('convert_jpg', True)
         if note_commands and 'convert' in note_commands:
             convert_enabled = note_commands['convert']
@@ -313,6 +703,7 @@ class ImageHandler(FileSystemEventHandler):
 
         if not self._wait_for_file_ready(image_path):
             self.log(f"File not ready for conversion (timeout): {image_path.name}", "ERROR")
+            self.metrics.inc('errors_total', stage='file_wait')
             return image_path, False
 
         try:
@@ -324,107 +715,67 @@ class ImageHandler(FileSystemEventHandler):
             self.log(f"Converting {image_path.name} to JPG format", "INFO")
             quality = note_commands.get('quality', self.options.get('jpg_quality', 95)) if note_commands else self.options.get('jpg_quality', 95)
             bg_color = note_commands.get('bg_color', self.options.get('bg_color', '#FFFFFF')) if note_commands else self.options.get('bg_color', '#FFFFFF')
-            if not bg_color.startswith('#'):
-                bg_color = '#' + bg_color
+            bg_rgb = self._parse_bg_color(bg_color)
 
-            with Image.open(image_path) as img:
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    try:
-                        bg_rgb = tuple(int(bg_color[i:i+2], 16) for i in (1, 3, 5))
-                    except ValueError:
-                        bg_rgb = (255, 255, 255)
-                        self.log(f"Invalid bg color {bg_color}, using white", "WARNING")
-                    background = Image.new('RGB', img.size, bg_rgb)
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
+            bytes_in = image_path.stat().st_size
+            with Image.open(image_path) as source:
+                if self._is_animated(source, image_path):
+                    result = self._convert_animated(source, image_path, quality, bg_rgb, variants)
+                    if result[1]:
+                        self._count_conversion(bytes_in, result[0])
+                    return result
 
                 jpg_path = image_path.with_suffix('.jpg')
-                img.save(jpg_path, 'JPEG', quality=quality, optimize=self.options.get('optimize_jpg', True))
+                self.recent_files.mark_own(jpg_path)
+                if not self._write_jpg(source, image_path, jpg_path, quality, bg_rgb, variants):
+                    self.metrics.inc('errors_total', stage='convert')
+                    return image_path, False
                 self.log(f"Saved converted image as {jpg_path.name} (quality {quality}%)", "INFO")
 
-            if self.options.get('delete_original', True):
-                try:
-                    image_path.unlink()
-                    self.log(f"Deleted original file {image_path.name}", "DEBUG")
-                except Exception as e:
-                    self.log(f"Could not delete original {image_path.name}: {e}", "WARNING")
-
+            self._count_conversion(bytes_in, jpg_path)
+            self._delete_original(image_path)
             return jpg_path, True
 
         except ImportError:
             self.log("Pillow not installed; cannot convert to JPG", "ERROR")
+            self.metrics.inc('errors_total', stage='convert')
             return image_path, False
         except FileNotFoundError:
             self.log(f"File vanished before conversion: {image_path}", "ERROR")
+            self.metrics.inc('errors_total', stage='convert')
             return image_path, False
         except Exception as e:
             self.log(f"Error converting {image_path.name} to JPG: {e}", "ERROR")
+            self.metrics.inc('errors_total', stage='convert')
             return image_path, False
+
+    def _count_conversion(self, bytes_in, output_path):
+        self.metrics.inc('conversions_total')
+        self.metrics.inc('conversion_bytes_in_total', bytes_in)
+        try:
+            self.metrics.inc('conversion_bytes_out_total', output_path.stat().st_size)
+        except OSError:
+            pass
     
+    def _find_note(self):
+        # A route can pin its images to one note instead of following the latest edit
+        target_note = self.options.get('target_note')
+        if target_note:
+            target_path = Path(target_note)
+            if not target_path.is_absolute():
+                target_path = self.obsidian_vault_path / target_path
+            if target_path.exists():
+                return target_path
+            self.log(f"Target note not found, using latest note instead: {target_path}", "WARNING")
+        return self.note_resolver.resolve()
+
     def get_last_modified_note(self):
-        """Find the most recently modified .md file in the vault with caching"""
+        """Note new images go into: the route's target note, else the note_resolver's pick."""
         try:
-            # Check if we have a cached note and if it's still valid
-            if self._cached_note_path and self._note_cache_valid:
-                try:
-                    current_mtime = self._cached_note_path.stat().st_mtime
-                    # If the cached note is still the most recent, return it
-                    if current_mtime >= self._cached_note_mtime:
-                        self.log(f"Using cached note: {self._cached_note_path}", "DEBUG")
-                        return self._cached_note_path
-                except (OSError, FileNotFoundError):
-                    # Cached file no longer exists, invalidate cache
-                    self._note_cache_valid = False
-            
-            # Cache miss or invalid - do full search
-            self.log("Performing full note search (cache miss)", "DEBUG")
-            
-            # Use os.walk for faster directory traversal with skipping
-            md_files = []
-            skip_dirs = {'.git', '.obsidian'}
-            
-            if self.options.get('recursive', True):
-                for root, dirs, files in os.walk(self.obsidian_vault_path):
-                    # Skip unwanted directories in-place (modifies dirs list)
-                    dirs[:] = [d for d in dirs if d not in skip_dirs]
-                    
-                    # Process .md files in current directory
-                    for file in files:
-                        if file.endswith('.md'):
-                            # Skip .excalidraw.md files if requested
-                            if self.options.get('skip_excalidraw', True) and file.endswith('.excalidraw.md'):
-                                continue
-                            md_files.append(Path(root) / file)
-            else:
-                # Non-recursive: only check immediate directory
-                for file in self.obsidian_vault_path.iterdir():
-                    if file.is_file() and file.suffix.lower() == '.md':
-                        # Skip .excalidraw.md files if requested
-                        if self.options.get('skip_excalidraw', True) and file.name.endswith('.excalidraw.md'):
-                            continue
-                        md_files.append(file)
-            
-            if not md_files:
-                raise Exception(f"No markdown (.md) files found in vault")
-            
-            self.log(f"Found {len(md_files)} markdown files in vault", "INFO")
-            
-            # Sort by modification time, most recent first
-            latest_note = max(md_files, key=lambda x: x.stat().st_mtime)
-            
-            # Update cache
-            self._cached_note_path = latest_note
-            self._cached_note_mtime = latest_note.stat().st_mtime
-            self._note_cache_valid = True
-            
-            self.log(f"Using most recently modified note: {latest_note}", "INFO")
-            return latest_note
+            return self._find_note()
         except Exception as e:
             self.log(f"Error finding last modified markdown note: {str(e)}", "ERROR")
+            self.metrics.inc('errors_total', stage='note_lookup')
             raise
     
     def parse_note_commands(self, content):
@@ -454,8 +805,11 @@ class ImageHandler(FileSystemEventHandler):
         
         return commands
 
-    def get_effective_prefix(self, content, note_commands=None, note_path=None):
-        """Get the effective prefix considering automatic, override, note commands, and auto-detection"""
+    def get_effective_prefix(self, content, note_commands=None, note_path=None, image_path=None, note_state=None):
+        """
+        Get the effective prefix considering automatic, override, note commands, and auto-detection.
+        A cached `note_state` for `content` saves re-scanning it for image codes.
+        """
         
         # Priority 1: Automatic prefix system (if enabled)
         if self.options.get('automatic_prefix_enabled', False):
@@ -477,72 +831,188 @@ class ImageHandler(FileSystemEventHandler):
             self.log(f"Using note command prefix: {note_commands['prefix']}", "INFO")
             return note_commands['prefix']
         
-        # Priority 4: Auto-detected prefix (if auto-numbering is enabled)
+        # Priority 4: Subfolder the image was saved into (recursive watching)
+        if self.options.get('subfolder_prefix_enabled', False):
+            subfolder_prefix = self.get_subfolder_prefix(image_path)
+            if subfolder_prefix:
+                self.log(f"Using subfolder prefix: {subfolder_prefix}", "INFO")
+                return subfolder_prefix
+        
+        # Priority 5: Auto-detected prefix (if auto-numbering is enabled)
         if self.options.get('auto_numbering', True) or (note_commands and note_commands.get('numbering')):
-            # Use pre-compiled pattern for better performance
-            matches = self._compiled_patterns['image_code'].findall(content)
+            if note_state and note_state.partial and not note_state.prefix_counts and note_path:
+                self._complete_code_stats(note_state, note_path)
+            prefix_counts = note_state.prefix_counts if note_state else self._image_code_stats(content)[0]
             
-            if matches:
-                # Count occurrences of each prefix
-                prefix_counts = {}
-                for prefix, number in matches:
-                    prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
-                
+            if prefix_counts:
                 # Use the most common prefix
                 most_common_prefix = max(prefix_counts.keys(), key=lambda x: prefix_counts[x])
                 self.log(f"Auto-detected prefix: {most_common_prefix}", "INFO")
                 return most_common_prefix
         
-        # Priority 5: Default prefix (lowest priority)
+        # Priority 6: Default prefix (lowest priority)
         self.log(f"Using default prefix: {self.default_prefix}", "INFO")
         return self.default_prefix
 
-    def extract_prefix_and_highest_number(self, content, note_commands=None, note_path=None):
+    def extract_prefix_and_highest_number(self, content, note_commands=None, note_path=None, image_path=None,
+                                          note_state=None):
         """Extract prefix and find highest number from existing image codes"""
         # Get the effective prefix
-        effective_prefix = self.get_effective_prefix(content, note_commands, note_path)
+        effective_prefix = self.get_effective_prefix(content, note_commands, note_path, image_path, note_state)
         
         # If numbering is disabled, return prefix with number 0
         if not self.options.get('auto_numbering', True) and not (note_commands and note_commands.get('numbering')):
             return effective_prefix, 0
         
-        # For automatic prefix system, always start numbering at 1 instead of finding highest
+        # Highest number per prefix comes from the cached note state when there is one
+        if note_state and note_state.partial and effective_prefix not in note_state.highest_numbers and note_path:
+            self._complete_code_stats(note_state, note_path)
+        highest_numbers = note_state.highest_numbers if note_state else self._image_code_stats(content)[1]
+        highest_number = highest_numbers.get(effective_prefix, 0)
+        
         if self.options.get('automatic_prefix_enabled', False):
-            # Use pre-compiled pattern for better performance
-            matches = self._compiled_patterns['image_code'].findall(content)
-            
-            if not matches:
-                return effective_prefix, 0
-            
-            # Find the highest number for the effective prefix
-            prefix_numbers = []
-            for prefix, number in matches:
-                self.log(f"Checking existing image: '{prefix}' #' {number}'", "DEBUG")
-                if prefix == effective_prefix:
-                    prefix_numbers.append(int(number))
-            
-            highest_number = max(prefix_numbers) if prefix_numbers else 0
             self.log(f"Using automatic prefix: {effective_prefix}, highest number: {highest_number}", "INFO")
-            return effective_prefix, highest_number
-        
-        # Use pre-compiled pattern for better performance
-        matches = self._compiled_patterns['image_code'].findall(content)
-        
-        if not matches:
-            return effective_prefix, 0
-        
-        # Find the highest number for the effective prefix
-        prefix_numbers = []
-        for prefix, number in matches:
-            if prefix == effective_prefix:
-                prefix_numbers.append(int(number))
-        
-        highest_number = max(prefix_numbers) if prefix_numbers else 0
-        self.log(f"Using prefix: {effective_prefix}, highest number: {highest_number}", "INFO")
+        else:
+            self.log(f"Using prefix: {effective_prefix}, highest number: {highest_number}", "INFO")
         return effective_prefix, highest_number
     
-    def process_image(self, original_path):
-        """Main processing function with optimized file I/O and safer conversion."""
+    HEAVY_SUFFIXES = {'.tif', '.tiff', '.heic', '.heif', '.avif', '.bmp'}
+
+    def job_lane(self, path):
+        """
+        Scheduler lane for an incoming image: 'fast' when processing is a rename and an append
+        or a small conversion, 'slow' for large files and formats that are expensive to decode.
+        """
+        suffix = path.suffix.lower()
+        needs_conversion = self.options.get('convert_jpg', True) and suffix not in ('.jpg', '.jpeg')
+        if not needs_conversion and not self._variant_specs():
+            return 'fast'
+        if suffix in self.HEAVY_SUFFIXES:
+            return 'slow'
+        if suffix == '.gif' and self.options.get('animated_policy', 'keep') == 'webp':
+            return 'slow'
+        try:
+            size = path.stat().st_size
+        except OSError:
+            size = 0
+        return 'slow' if size > self.options.get('fast_lane_max_kb', 2048) * 1024 else 'fast'
+
+    def job_note(self):
+        """
+        Note an image queued now will be added to, so the scheduler can sequence appends per note
+        in capture order. None when nothing is written to a note or no note can be found.
+        """
+        if not self.options.get('add_to_note', True) and not self.options.get('clipboard_mode', False):
+            return None
+        try:
+            return self._find_note()
+        except Exception:
+            return None  # process_image looks again, and logs and counts the error
+
+    def _note_lock(self, key):
+        """Lock for the rename/append critical section, shared across handlers via the scheduler."""
+        if self.scheduler is not None:
+            return self.scheduler.key_lock(str(key))
+        return self._local_lock
+
+    def _image_code_stats(self, content):
+        """Per prefix: how many image codes use it (in order of first use) and its highest number."""
+        prefix_counts = {}
+        highest_numbers = {}
+        for prefix, number in self._compiled_patterns['image_code'].findall(content):
+            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+            highest_numbers[prefix] = max(highest_numbers.get(prefix, 0), int(number))
+        return prefix_counts, highest_numbers
+
+    def _parse_note_state(self, content, st):
+        prefix_counts, highest_numbers = self._image_code_stats(content)
+        return NoteState(content, st.st_mtime_ns, st.st_size, self.parse_note_commands(content),
+                         prefix_counts, highest_numbers)
+
+    def _read_note_state(self, note_path):
+        """
+        Read and parse a note, reusing the cached state while its mtime and size are unchanged.
+        Notes larger than large_note_kb are read in bounded mode (first block and tail only).
+        """
+        st = note_path.stat()
+        use_cache = self.options.get('note_content_cache', True)
+        if use_cache:
+            state = self.note_states.get(note_path, st.st_mtime_ns, st.st_size)
+            if state is not None:
+                self.log(f"Reusing cached state of {note_path.name}", "DEBUG")
+                return state
+        large_note_bytes = self.options.get('large_note_kb', 1024) * 1024
+        if large_note_bytes and st.st_size > large_note_bytes:
+            state = self._read_bounded_state(note_path, st)
+        else:
+            with open(note_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            state = self._parse_note_state(content, st)
+        if use_cache:
+            self.note_states.put(note_path, state)
+        return state
+
+    NOTE_HEAD_BYTES = 16 * 1024
+    NOTE_TAIL_WINDOW = 64 * 1024
+
+    @staticmethod
+    def _first_block(text):
+        """The note's frontmatter (if any) and the first paragraph after it."""
+        start = 0
+        if text.startswith('---'):
+            end = text.find('\n---', 3)
+            if end != -1:
+                start = end + 4
+        while start < len(text) and text[start] in '\r\n':
+            start += 1
+        end = text.find('\n\n', start)
+        return text if end == -1 else text[:end]
+
+    def _byte_code_stats(self, data, start=0):
+        prefix_counts = {}
+        highest_numbers = {}
+        for prefix, number in self._image_code_bytes.findall(data, start):
+            prefix = prefix.decode('utf-8', errors='replace')
+            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+            highest_numbers[prefix] = max(highest_numbers.get(prefix, 0), int(number))
+        return prefix_counts, highest_numbers
+
+    def _read_bounded_state(self, note_path, st):
+        """
+        Parse a large note without reading all of it: note commands from the frontmatter or first
+        block, image codes from a tail window that grows backwards (through mmap) until it holds
+        at least one code or reaches note_tail_kb.
+        """
+        max_tail = max(self.NOTE_TAIL_WINDOW, self.options.get('note_tail_kb', 256) * 1024)
+        with open(note_path, 'rb') as f:
+            head = f.read(self.NOTE_HEAD_BYTES).decode('utf-8', errors='ignore')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                size = len(mm)
+                window = self.NOTE_TAIL_WINDOW
+                while True:
+                    start = max(0, size - window)
+                    prefix_counts, highest_numbers = self._byte_code_stats(mm, start)
+                    if prefix_counts or start == 0 or window >= max_tail:
+                        break
+                    window = min(window * 4, max_tail)
+        self.log(f"Read {note_path.name} in bounded mode ({st.st_size // 1024} KB note, "
+                 f"last {(size - start) // 1024} KB scanned)", "DEBUG")
+        return NoteState(None, st.st_mtime_ns, st.st_size, self.parse_note_commands(self._first_block(head)),
+                         prefix_counts, highest_numbers, partial=start > 0)
+
+    def _complete_code_stats(self, note_state, note_path):
+        """Fill in numbering from the whole note when the tail of a bounded read had no answer."""
+        self.log(f"Tail of {note_path.name} has no answer, scanning the whole note", "DEBUG")
+        with open(note_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            note_state.prefix_counts, note_state.highest_numbers = self._byte_code_stats(mm)
+        note_state.partial = False
+
+    def process_image(self, original_path, ticket=None):
+        """
+        Main processing function with optimized file I/O and safer conversion.
+        `ticket` comes from the scheduler's NoteSequencer: it fixes the note when the image was
+        queued, and the append is deferred until earlier captures for that note are written.
+        """
         start_time = time.time()
         self.log(f"Processing new image: {original_path}", "INFO")
 
@@ -550,7 +1020,9 @@ class ImageHandler(FileSystemEventHandler):
             # Only wait if we will convert
             if self.options.get('convert_jpg', True) and original_path.suffix.lower() not in ('.jpg', '.jpeg'):
                 self._wait_for_file_ready(original_path)
-            self.convert_to_jpg(original_path)
+            variants = {} if self._variant_specs() else None
+            processed_path, _ = self.convert_to_jpg(original_path, variants=variants)
+            self._save_variants(variants, processed_path, processed_path.stem)
             self.log("Note insertion disabled, processing complete", "INFO")
             return
 
@@ -559,37 +1031,58 @@ class ImageHandler(FileSystemEventHandler):
             (self.options.get('convert_jpg', True) and original_path.suffix.lower() not in ('.jpg', '.jpeg'))
             or self.options.get('auto_rename', True)
         )
-        if needs_wait and not self._wait_for_file_ready(original_path):
-            self.log(f"File not ready, aborting processing: {original_path.name}", "ERROR")
-            return
+        if needs_wait:
+            with self.stage_timings.measure('file_wait'):
+                ready = self._wait_for_file_ready(original_path)
+            if not ready:
+                self.log(f"File not ready, aborting processing: {original_path.name}", "ERROR")
+                self.metrics.inc('errors_total', stage='file_wait')
+                return
 
-        note_path = self.get_last_modified_note()
+        with self.stage_timings.measure('note_lookup'):
+            note_path = ticket.note_path if ticket else self.get_last_modified_note()
 
-        # Cached note content optimization
-        content_mtime = note_path.stat().st_mtime
-        use_cache = self.options.get('note_content_cache', True)
-        if use_cache and self._cached_note_content and self._cached_note_content_mtime == content_mtime and self._note_cache_valid:
-            original_content = self._cached_note_content
-            self.log("Reusing cached note content", "DEBUG")
-        else:
-            with open(note_path, 'r', encoding='utf-8') as f:
-                original_content = f.read()
-            if use_cache:
-                self._cached_note_content = original_content
-                self._cached_note_content_mtime = content_mtime
-                self._note_cache_valid = True
-        note_commands = self.parse_note_commands(original_content)
+            # Cached note state optimization
+            note_commands = self._read_note_state(note_path).commands
         if note_commands:
             self.log(f"Applied note commands: {note_commands}", "DEBUG")
 
-        processed_path, converted = self.convert_to_jpg(original_path, note_commands)
+        variants = {} if self._variant_specs() else None
+        with self.stage_timings.measure('convert'):
+            processed_path, converted = self.convert_to_jpg(original_path, note_commands, variants)
 
         # If conversion failed and original still missing, abort
         if not processed_path.exists():
             self.log(f"Abort: source file missing after conversion attempt: {original_path.name}", "ERROR")
+            self.metrics.inc('errors_total', stage='convert')
             return
 
-        prefix, highest_number = self.extract_prefix_and_highest_number(original_content, note_commands, note_path)
+        # Numbering, rename and append must see the note as the previous image left it:
+        # conversion above runs in parallel, this part is serialized per note and per folder
+        def append():
+            with self._note_lock(note_path), self._note_lock(processed_path.parent), \
+                    self.stage_timings.measure('append'):
+                # Another job may have appended to the note while this one was converting
+                note_state = self._read_note_state(note_path)
+                self._name_and_append(original_path, processed_path, note_path, note_state,
+                                      note_commands, variants, start_time)
+
+        if ticket is None:
+            append()
+        elif not self.scheduler.sequencer.run_in_turn(ticket, append):
+            self.log(f"Holding {processed_path.name} until earlier images for {note_path.name} are added", "DEBUG")
+
+    def _name_and_append(self, original_path, processed_path, note_path, note_state,
+                         note_commands, variants, start_time):
+        """Allocate the {prefix}_{n} name, rename, write renditions and append the image code."""
+        original_content = note_state.content
+        prefix, highest_number = self.extract_prefix_and_highest_number(original_content, note_commands, note_path,
+                                                                          original_path, note_state)
+        # Codes held for a combined write are not in the note yet
+        held = self.note_writer.pending(note_path)
+        if held:
+            held_codes = '\n'.join(entry['image_code'] for entry, _, _ in held)
+            highest_number = max(highest_number, self._image_code_stats(held_codes)[1].get(prefix, 0))
 
         auto_rename = self.options.get('auto_rename', True)
         if note_commands and 'rename' in note_commands:
@@ -599,17 +1092,25 @@ class ImageHandler(FileSystemEventHandler):
         if note_commands and 'numbering' in note_commands:
             auto_numbering = note_commands['numbering']
 
-        # Only force .jpg if conversion actually succeeded
-        target_suffix = processed_path.suffix if not converted else '.jpg'
+        # Conversion already produced the right suffix (.jpg, or .webp for animations)
+        target_suffix = processed_path.suffix
 
-        if auto_numbering:
+        if auto_numbering and auto_rename and self.numbering is not None and self.options.get('global_numbering', True):
+            # Next number for the prefix across the whole images folder, not just this note
+            def is_taken(number):
+                path = processed_path.parent / f"{prefix}_{number}{target_suffix}"
+                return (path.exists() or path in self._reserved_paths) and path != processed_path
+            new_number = self.numbering.allocate(prefix, highest_number, is_taken)
+            new_filename = f"{prefix}_{new_number}{target_suffix}"
+            new_path = processed_path.parent / new_filename
+        elif auto_numbering:
             new_number = highest_number + 1
             new_filename = f"{prefix}_{new_number}{target_suffix}"
             new_path = processed_path.parent / new_filename
             
             # Conflict resolution: Ensure file doesn't exist on disk
             # This handles cases where file exists but isn't linked in the note
-            while new_path.exists() and new_path != processed_path:
+            while (new_path.exists() or new_path in self._reserved_paths) and new_path != processed_path:
                 self.log(f"File {new_filename} already exists, incrementing index...", "DEBUG")
                 new_number += 1
                 new_filename = f"{prefix}_{new_number}{target_suffix}"
@@ -623,23 +1124,65 @@ class ImageHandler(FileSystemEventHandler):
             
             # Conflict resolution: Ensure file doesn't exist on disk
             # This handles cases where file exists but isn't linked in the note
-            while new_path.exists() and new_path != processed_path:
+            while (new_path.exists() or new_path in self._reserved_paths) and new_path != processed_path:
                 self.log(f"File {new_filename} already exists, incrementing timestamp/index...", "DEBUG")
                 new_number += 1 # Use new_number as an increment for timestamp conflicts
                 new_filename = f"{prefix}_{timestamp}_{new_number}{target_suffix}"
                 new_path = processed_path.parent / new_filename
 
-        if auto_rename:
+        final_path = processed_path
+        if auto_rename and processed_path.name != new_filename:
             try:
-                if processed_path.name != new_filename:
-                    processed_path.rename(new_path)
-                    self.log(f"Renamed {processed_path.name} -> {new_filename}", "INFO")
-                final_filename = new_filename
+                self.recent_files.mark_own(new_path)
+                processed_path.rename(new_path)
+                self.log(f"Renamed {processed_path.name} -> {new_filename}", "INFO")
+                final_path = new_path
+            except PermissionError:
+                self._retry_rename(original_path, processed_path, new_path, note_path, note_commands, variants,
+                                   start_time)
+                return
             except Exception as e:
                 self.log(f"Error renaming file ({processed_path.name}): {e}", "ERROR")
-                final_filename = processed_path.name
-        else:
-            final_filename = processed_path.name
+                self.metrics.inc('errors_total', stage='rename')
+        elif auto_rename:
+            final_path = new_path
+
+        self._finish_append(original_path, final_path, note_path, note_state, note_commands, variants,
+                            start_time)
+
+    def _retry_rename(self, original_path, processed_path, new_path, note_path, note_commands, variants, start_time):
+        """
+        Retry a rename blocked by another process. The job gives up its place in the note (later
+        images are added meanwhile) but keeps the allocated name, and resumes from the rename.
+        """
+        self._reserved_paths.add(new_path)
+
+        def attempt():
+            with self._note_lock(note_path), self._note_lock(processed_path.parent):
+                self.recent_files.mark_own(new_path)
+                processed_path.rename(new_path)
+                self._reserved_paths.discard(new_path)
+                self.log(f"Renamed {processed_path.name} -> {new_path.name}", "INFO")
+                self._finish_append(original_path, new_path, note_path, self._read_note_state(note_path),
+                                    note_commands, variants, start_time)
+
+        def give_up(error):
+            # Same as a failed rename: link the file under the name it already has
+            with self._note_lock(note_path), self._note_lock(processed_path.parent):
+                self._reserved_paths.discard(new_path)
+                self._finish_append(original_path, processed_path, note_path, self._read_note_state(note_path),
+                                    note_commands, variants, start_time)
+
+        self.retries.schedule(f"Rename {processed_path.name} -> {new_path.name}", attempt, give_up,
+                              max_age=self.options.get('retry_max_age', 120))
+
+    def _finish_append(self, original_path, final_path, note_path, note_state, note_commands, variants,
+                       start_time):
+        """Write renditions under the final name, then add the image code to the note (or clipboard)."""
+        final_filename = final_path.name
+
+        # Extra renditions share the allocated {prefix}_{n} name
+        saved_variants = self._save_variants(variants, final_path, final_path.stem)
 
         image_format = note_commands.get('format') if note_commands else self.options.get('image_format', "[[File:{filename}]]")
         image_code = image_format.replace('{filename}', final_filename) if image_format else f"[[File:{final_filename}]]"
@@ -648,44 +1191,144 @@ class ImageHandler(FileSystemEventHandler):
             if self.clipboard_callback:
                 self.clipboard_callback(image_code)
                 self.log(f"Copied {image_code} to clipboard", "SUCCESS")
+                self.metrics.inc('images_processed_total')
             else:
                 self.log(f"Clipboard mode enabled but no callback provided. Code: {image_code}", "WARNING")
             return
 
-        separator_text = note_commands.get('separator') if note_commands and 'separator' in note_commands else self.options.get('separator', '')
-        separator = '\n' + separator_text if separator_text else '\n'
-
-        final_content = original_content
-        if note_commands and self.options.get('clean_commands', False):
-            final_content = self._clean_commands_from_content(final_content)
-        final_content += f"{separator}{image_code}"
-
-        with open(note_path, 'w', encoding='utf-8') as f:
-            f.write(final_content)
-        # Update content cache instantly (avoid re-read on next image)
-        if self.options.get('note_content_cache', True):
-            self._cached_note_content = final_content
-            self._cached_note_content_mtime = note_path.stat().st_mtime
-            self._note_cache_valid = True
-        self._note_cache_valid = False  # existing invalidation (can remove if relying on content cache)
-        self.log(f"Added {image_code} to {note_path.name} (processed in {time.time() - start_time:.2f}s)", "INFO")
-        
-        # Add to history - use correct final path based on whether rename succeeded
-        if auto_rename and final_filename == new_filename:
-            final_path = new_path
-        else:
-            final_path = processed_path
-            
-        self.history.insert(0, {
+        entry = {
             'original_path': original_path,
             'current_path': final_path,
             'image_code': image_code,
             'note_path': note_path,
-            'timestamp': time.time()
-        })
+            'variants': saved_variants,
+            'handler': self,
+        }
+        item = (entry, note_commands, start_time)
+        gallery_window = self.options.get('gallery_window', 0)
+        if gallery_window > 0:
+            # Gallery mode: written as one block once no image has arrived for gallery_window seconds,
+            # or once the block is gallery_max_age seconds old or holds gallery_max_items images
+            self.note_writer.add(note_path, item, delay=gallery_window,
+                                 max_age=self.options.get('gallery_max_age', 60))
+            if len(self.note_writer.pending(note_path)) >= self.options.get('gallery_max_items', 24):
+                self._write_appends(note_path, self.note_writer.take(note_path), note_state)
+                return
+            self.log(f"Holding {image_code} for the gallery block in {note_path.name}", "DEBUG")
+            return
+        if self.scheduler is None or not self.options.get('append_batch_ms', 250):
+            self._write_appends(note_path, [item], note_state)
+            return
+        self.note_writer.add(note_path, item)
+        # Another image for this note is still queued or converting: let it join the write
+        if self.scheduler.sequencer.outstanding(note_path) > 1:
+            self.log(f"Holding {image_code} for a combined write to {note_path.name}", "DEBUG")
+            return
+        self._write_appends(note_path, self.note_writer.take(note_path), note_state)
+
+    def _write_held(self, note_path):
+        """Write appends held for the note (timer expiry or stop); the caller does not hold its lock."""
+        with self._note_lock(note_path):
+            items = self.note_writer.take(note_path)
+            if items:
+                self._write_appends(note_path, items, self._read_note_state(note_path))
+
+    def flush_held_appends(self):
+        for note_path in self.note_writer.note_paths():
+            self._write_held(note_path)
+
+    def _write_appends(self, note_path, items, note_state):
+        """Append (entry, note_commands, start_time) items to the note, retrying later if it is locked."""
+        try:
+            with self.stage_timings.measure('note_write'):
+                self._append_entries(note_path, items, note_state)
+        except PermissionError:
+            def attempt():
+                with self._note_lock(note_path):
+                    self._append_entries(note_path, items, self._read_note_state(note_path))
+
+            codes = ', '.join(entry['image_code'] for entry, _, _ in items)
+            self.retries.schedule(f"Add {codes} to {note_path.name}", attempt,
+                                  max_age=self.options.get('retry_max_age', 120))
+
+    def _cache_appended_state(self, note_path, note_state, added):
+        """Cache the note as just appended to, updating its previous state rather than re-parsing it."""
+        st = note_path.stat()
+        prefix_counts = dict(note_state.prefix_counts)
+        highest_numbers = dict(note_state.highest_numbers)
+        for prefix, number in self._compiled_patterns['image_code'].findall(added):
+            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+            highest_numbers[prefix] = max(highest_numbers.get(prefix, 0), int(number))
+        content = note_state.content + added if note_state.content is not None else None
+        self.note_states.put(note_path, NoteState(content, st.st_mtime_ns, st.st_size, note_state.commands,
+                                                  prefix_counts, highest_numbers, note_state.partial))
+
+    def _gallery_block(self, items):
+        """gallery_template with {images} (one gallery_item line per image) and {count} filled in."""
+        item_format = self.options.get('gallery_item', '> {image}') or '{image}'
+        lines = '\n'.join(item_format.replace('{image}', entry['image_code'])
+                          .replace('{filename}', entry['current_path'].name) for entry, _, _ in items)
+        template = self.options.get('gallery_template', '> [!gallery] {count} images\n{images}') or '{images}'
+        return template.replace('{count}', str(len(items))).replace('{images}', lines)
+
+    def _append_entries(self, note_path, items, note_state):
+        """Append the items' image codes to the note in one write and record them in the history."""
+        separators = []
+        for _, note_commands, _ in items:
+            separator_text = note_commands.get('separator') if note_commands and 'separator' in note_commands else self.options.get('separator', '')
+            separators.append('\n' + separator_text if separator_text else '\n')
+        gallery = len(items) > 1 and self.options.get('gallery_window', 0) > 0
+        if gallery:
+            # One separator (the first image's) before the block, which starts on its own line and
+            # ends with one, so a later append is not pulled into a callout or table
+            separator = separators[0] if separators[0].endswith('\n') else separators[0] + '\n'
+            added = separator + self._gallery_block(items) + '\n'
+        else:
+            added = ''.join(f"{separator}{entry['image_code']}" for separator, (entry, _, _) in zip(separators, items))
+
+        rewritten = None
+        if any(note_commands for _, note_commands, _ in items) and self.options.get('clean_commands', False):
+            content = note_state.content
+            if content is None:
+                with open(note_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            cleaned = self._clean_commands_from_content(content)
+            if cleaned != content:
+                rewritten = cleaned + added
+
+        if rewritten is not None:
+            with open(note_path, 'w', encoding='utf-8') as f:
+                f.write(rewritten)
+        else:
+            # Appending leaves the rest of the note untouched, however large it is
+            with open(note_path, 'a', encoding='utf-8') as f:
+                f.write(added)
+        # Update the cached note state instantly (avoid re-read and re-parse on next image)
+        if self.options.get('note_content_cache', True):
+            if rewritten is not None:
+                self.note_states.put(note_path, self._parse_note_state(rewritten, note_path.stat()))
+            else:
+                self._cache_appended_state(note_path, note_state, added)
+        self.note_resolver.invalidate()
+        if self.link_index is not None:
+            if rewritten is not None:
+                self.link_index.update_note(note_path)
+            else:
+                self.link_index.note_appended(note_path, added)
+        if gallery:
+            self.log(f"Wrote a gallery block of {len(items)} images to {note_path.name}", "INFO")
+        elif len(items) > 1:
+            self.log(f"Wrote {len(items)} image codes to {note_path.name} in one append", "DEBUG")
+
+        now = time.time()
+        for entry, _, start_time in items:
+            self.stage_timings.record('total', now - start_time)
+            self.metrics.inc('images_processed_total')
+            self.log(f"Added {entry['image_code']} to {note_path.name} (processed in {now - start_time:.2f}s)", "INFO")
+            # Add to history
+            self.history.insert(0, dict(entry, timestamp=now))
         # Keep history limited to e.g. 50 items
-        if len(self.history) > 50:
-            self.history.pop()
+        del self.history[50:]
         
         # Notify GUI if callback is set
         if self.history_callback:
@@ -768,19 +1411,49 @@ class ImageHandler(FileSystemEventHandler):
             
             # Rename the file
             if new_path != current_path:
+                self.recent_files.mark_own(new_path)
                 current_path.rename(new_path)
                 self.log(f"Renamed {current_path.name} -> {new_filename}", "INFO")
-            
+                if self.numbering is not None:
+                    self.numbering.record_name(new_filename)
+
+                # Keep extra renditions in step with the main file
+                for name, variant_path in item.get('variants', {}).items():
+                    try:
+                        renamed = variant_path.with_name(f"{new_stem}{variant_path.suffix}")
+                        variant_path.rename(renamed)
+                        item['variants'][name] = renamed
+                    except OSError as e:
+                        self.log(f"Could not rename {name} variant {variant_path.name}: {e}", "WARNING")
+
+            old_filename = current_path.name
+            new_image_code = old_image_code.replace(old_filename, new_filename)
+            item['current_path'] = new_path
+
+            # Rewrite every note that embeds the image, not just the one it was added to
+            if self.link_index is not None and self.link_index.ready.is_set() and new_path != current_path:
+                updated_notes = self.link_index.rename_references({old_filename: new_filename})
+                item['image_code'] = new_image_code
+                # A code written in another format (e.g. a note's format command) is replaced as written
+                if note_path and note_path not in updated_notes and note_path.exists():
+                    with open(note_path, 'r', encoding='utf-8') as f:
+                        note_content = f.read()
+                    if old_image_code in note_content:
+                        with open(note_path, 'w', encoding='utf-8') as f:
+                            f.write(note_content.replace(old_image_code, new_image_code))
+                        self.link_index.update_note(note_path)
+                        updated_notes.append(note_path)
+                if updated_notes:
+                    self.log(f"Updated {old_filename} -> {new_filename} in {len(updated_notes)} note(s): "
+                             f"{', '.join(p.name for p in updated_notes)}", "INFO")
+                else:
+                    self.log(f"Warning: No notes reference {old_filename}, only file renamed", "WARNING")
             # Update image code in note if applicable
-            if note_path and note_path.exists():
+            elif note_path and note_path.exists():
                 try:
                     with open(note_path, 'r', encoding='utf-8') as f:
                         note_content = f.read()
                     
-                    # Build new image code (preserve format structure)
-                    old_filename = current_path.name
-                    new_image_code = old_image_code.replace(old_filename, new_filename)
-                    
                     if old_image_code in note_content:
                         updated_content = note_content.replace(old_image_code, new_image_code)
                         with open(note_path, 'w', encoding='utf-8') as f:
@@ -788,20 +1461,16 @@ class ImageHandler(FileSystemEventHandler):
                         self.log(f"Updated image code in {note_path.name}: {old_image_code} -> {new_image_code}", "INFO")
                         
                         # Update history entry
-                        item['current_path'] = new_path
                         item['image_code'] = new_image_code
                     else:
                         # Image code not found (maybe note was edited), just update file reference
-                        item['current_path'] = new_path
                         self.log(f"Warning: Image code not found in note, only file renamed", "WARNING")
                 except Exception as e:
                     # File rename succeeded but note update failed
-                    item['current_path'] = new_path
                     self.log(f"Warning: Could not update note: {e}", "WARNING")
             else:
                 # No note associated
-                item['current_path'] = new_path
-                item['image_code'] = old_image_code.replace(current_path.name, new_filename)
+                item['image_code'] = new_image_code
             
             return True, f"Renamed to {new_filename}"
             
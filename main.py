@@ -1,3 +1,4 @@
+import os
 import time
 import threading
 import ctypes
@@ -8,6 +9,13 @@ from pathlib import Path
 from watchdog.observers import Observer
 
 from image_handler import ImageHandler
+from vault_index import VaultLinkIndex, VaultIndexHandler
+from router import Route, RouteDispatcher, route_settings
+from path_rules import RecentFiles
+from numbering import NumberingRegistry
+from control_server import ControlServer
+from metrics import Metrics, MetricsFileExporter
+from work_scheduler import WorkScheduler
 from settings_manager import SettingsManager
 from gui_tabs import MainSettingsTab, ImageProcessingTab, NoteProcessingTab, NoteCommandsTab, RecentImagesTab
 from theme_manager import ModernThemeManager
@@ -34,14 +42,26 @@ class ImageProcessorGUI:
         self.note_commands = self._create_note_command_variables()
         
         self.observer = None
-        self.handler = None  # Keep reference to handler
+        self.handler = None  # Keep reference to handler (main folder)
+        self.routes = []
+        self.route_configs = []  # extra watched folders, from the "routes" list in settings.json
+        self.scheduler = None
+        self.dispatcher = None
+        self.control_server = None
+        self.metrics = Metrics()  # for the whole session, across starts and stops
+        self.metrics.add_collector('app', self._collect_metrics)
+        self.metrics_exporter = None
+        self.link_indexes = {}
         self.is_running = False
+        self._queue_poll_job = None  # pending after() of the queue-depth indicator
 
         self._hotkey_thread = None
         self._hotkey_running = False
         
         self.setup_ui()
         self.load_settings()
+        self.start_control_server()
+        self.start_metrics_export()
 
         # start global hotkey listener (Windows)
         try:
@@ -66,6 +86,50 @@ class ImageProcessorGUI:
         except Exception as e:
             self.log_message(f"Failed to copy to clipboard: {e}", "ERROR")
 
+    def start_control_server(self):
+        """Serve the local control API when control_port is set (read at startup only)."""
+        port = self.settings['control_port'].get()
+        if not port:
+            return
+        try:
+            self.control_server = ControlServer(self, port, log_callback=self.log_message)
+            self.control_server.start()
+        except OSError as e:
+            self.control_server = None
+            self.log_message(f"Control API not available on port {port}: {e}", "WARNING")
+
+    def stop_control_server(self):
+        if self.control_server is not None:
+            self.control_server.stop()
+            self.control_server = None
+
+    def start_metrics_export(self):
+        """Write metric snapshots to metrics_file every metrics_interval seconds (read at startup only)."""
+        path = self.settings['metrics_file'].get().strip()
+        if not path:
+            return
+        self.metrics_exporter = MetricsFileExporter(self.metrics, path, self.settings['metrics_interval'].get(),
+                                                    self.settings['metrics_file_mb'].get() * 1024 * 1024,
+                                                    log_callback=self.log_message)
+        self.metrics_exporter.start()
+
+    def stop_metrics_export(self):
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+            self.metrics_exporter = None
+
+    def _collect_metrics(self):
+        yield 'monitoring', {}, int(self.is_running)
+        hits = misses = 0
+        for route in self.routes:
+            stats = route.handler.note_states.stats()
+            hits += stats['hits']
+            misses += stats['misses']
+        if hits or misses:
+            yield 'note_cache_hits_total', {}, hits
+            yield 'note_cache_misses_total', {}, misses
+            yield 'note_cache_hit_ratio', {}, hits / (hits + misses)
+
     def start_global_hotkey(self):
         """Start a background message loop and register Ctrl+Alt+A and Ctrl+Alt+D as global hotkeys (Windows)."""
         if self._hotkey_thread and self._hotkey_thread.is_alive():
@@ -178,7 +242,8 @@ class ImageProcessorGUI:
         """Called when override prefix changes - updates handler in real-time"""
         if self.handler and self.is_running:
             new_options = {key: var.get() for key, var in self.settings.items()}
-            self.handler.update_options(new_options)
+            for route in self.routes:
+                route.handler.update_options(route_settings(new_options, route.overrides)[0])
             
             override_value = self.settings['override_prefix'].get().strip()
             if override_value:
@@ -301,6 +366,10 @@ class ImageProcessorGUI:
         
         self.status_badge = self.theme.create_status_badge(status_frame, "⏹️ Stopped", "danger")
         self.status_badge.pack()
+        
+        self.queue_label = tk.Label(status_frame, text="", bg=self.theme.colors['bg_primary'],
+                                    fg=self.theme.colors['text_secondary'], font=('Segoe UI', 9))
+        self.queue_label.pack(side="bottom", pady=(4, 0))
     
     def setup_log_output(self, parent):
         """Setup the modern log output area"""
@@ -392,22 +461,32 @@ class ImageProcessorGUI:
             if self.settings['enable_note_commands'].get():
                 options['note_commands_enabled'] = {key: var.get() for key, var in self.note_commands.items()}
             
-            # Create handler and observer
-            self.handler = ImageHandler(vault_path, self.settings['default_prefix'].get(), 
-                                       options, log_callback=self.log_message,
-                                       clipboard_callback=self.copy_to_clipboard)
+            # Handlers for the main folder and every extra route, all on one observer and worker pool
+            self.scheduler = WorkScheduler(options.get('fast_lane_workers', 1), options.get('slow_lane_workers', 1),
+                                           log_callback=self.log_message,
+                                           queue_limit=options.get('queue_limit', 500),
+                                           overload_policy=options.get('overload_policy', 'spill'),
+                                           metrics=self.metrics)
+            self.routes = self._create_routes(options, vault_path, images_folder)
+            dispatcher = self.dispatcher = RouteDispatcher(self.routes)
             
-            # Connect history callback to auto-refresh the Recent Images tab
-            def on_history_updated():
-                # Schedule refresh on the main thread to be thread-safe
-                self.root.after(0, self._refresh_recent_images_tab)
-            self.handler.history_callback = on_history_updated
+            def resolve_handler(path):
+                route = dispatcher.route_for(str(path))
+                return route.handler if route else None
+            self.scheduler.resolve_handler = resolve_handler
             
             self.observer = Observer()
-            self.observer.schedule(self.handler, images_folder, recursive=False)
+            for folder, recursive in dispatcher.folders():
+                self.observer.schedule(dispatcher, str(folder), recursive=recursive)
+            for index_vault, link_index in self.link_indexes.items():
+                self.observer.schedule(VaultIndexHandler(link_index), index_vault, recursive=True)
             
             # Start monitoring in a separate thread
             self.observer.start()
+            for link_index in self.link_indexes.values():
+                link_index.build_async()
+            self.scheduler.resume_spilled()
+            self._poll_queue_depth()
             
             self.is_running = True
             self.start_button.config(text="⏹️ Stop Monitoring", style='Danger.TButton')
@@ -418,6 +497,9 @@ class ImageProcessorGUI:
             )
             self.status_badge.pack()
             self.log_message("🚀 Started monitoring " + images_folder)
+            for route in self.routes[:-1]:
+                self.log_message(f"Route '{route.name}': {route.watch_folder} ({route.pattern}) -> "
+                                 f"{route.handler.obsidian_vault_path}", "INFO")
             
             if self.settings['clipboard_mode'].get():
                 self.log_message("📋 Clipboard Mode Active: Image codes will be copied to clipboard", "INFO")
@@ -431,14 +513,102 @@ class ImageProcessorGUI:
             messagebox.showerror("Error", f"Failed to start monitoring: {str(e)}")
             self.log_message(f"Error: {str(e)}", "ERROR")
             
+    def _create_routes(self, options, vault_path, images_folder):
+        """
+        Build one ImageHandler per route (extra routes from settings.json first, so their
+        filename patterns win over the main folder's catch-all) sharing history, link indexes,
+        the duplicate-event filter and one numbering registry per images folder.
+        """
+        self.link_indexes = {}
+        recent_files = RecentFiles(options.get('dedup_ttl', 10))
+        registries = {}  # images folder -> NumberingRegistry, shared by routes watching the same folder
+
+        # Connect history callback to auto-refresh the Recent Images tab
+        def on_history_updated():
+            # Schedule refresh on the main thread to be thread-safe
+            self.root.after(0, self._refresh_recent_images_tab)
+
+        def make_handler(handler_vault, prefix, handler_options):
+            handler = ImageHandler(handler_vault, prefix, handler_options, log_callback=self.log_message,
+                                   clipboard_callback=self.copy_to_clipboard, scheduler=self.scheduler)
+            handler.history_callback = on_history_updated
+            # Filename -> notes index for reference-aware renames, one per vault, built in the background
+            link_index = self.link_indexes.get(handler_vault)
+            if link_index is None:
+                link_index = VaultLinkIndex(handler_vault, handler_options.get('image_format'),
+                                            log_callback=self.log_message)
+                self.link_indexes[handler_vault] = link_index
+            handler.link_index = link_index
+            handler.recent_files = recent_files
+            images_key = os.path.normcase(os.path.abspath(handler_options['images_folder']))
+            if images_key not in registries:
+                registries[images_key] = NumberingRegistry(handler_options['images_folder'], handler_options,
+                                                           log_callback=self.log_message)
+            handler.numbering = registries[images_key]
+            return handler
+
+        self.handler = make_handler(vault_path, options['default_prefix'], options)
+        routes = []
+        for i, config in enumerate(self.route_configs):
+            name = config.get('name') or f"route {i + 1}"
+            route_options, route_vault, prefix = route_settings(options, config)
+            watch_folder = config.get('watch_folder')
+            if not watch_folder or not Path(watch_folder).is_dir() or not Path(route_vault).is_dir():
+                self.log_message(f"Skipping route '{name}': watch folder or vault not found", "WARNING")
+                continue
+            handler = make_handler(route_vault, prefix, route_options)
+            handler.history = self.handler.history  # one Recent Images list for every route
+            routes.append(Route(name, watch_folder, handler, config.get('pattern', '*'), config))
+        routes.append(Route('main', images_folder, self.handler))
+        return routes
+
+    def _poll_queue_depth(self):
+        """Refresh the queue-depth indicator while monitoring (runs on the Tk thread)"""
+        self._queue_poll_job = None
+        if not self.scheduler:
+            self.queue_label.config(text="")
+            return
+        depth = self.scheduler.queue_depth()
+        text = f"Queue: {depth['fast']} fast · {depth['slow']} slow"
+        if depth['intake']:
+            text += f" · {depth['intake']} incoming"
+        if depth['spilled']:
+            text += f" · {depth['spilled']} spilled"
+        if depth['retrying']:
+            text += f" · {depth['retrying']} retrying"
+        self.queue_label.config(text=text)
+        self._queue_poll_job = self.root.after(500, self._poll_queue_depth)
+
     def stop_monitoring(self):
         """Stop the file monitoring process"""
+        if self._queue_poll_job is not None:
+            self.root.after_cancel(self._queue_poll_job)
+            self._queue_poll_job = None
+            self.queue_label.config(text="")
         if self.observer:
             self.observer.stop()
             self.observer.join()
             self.observer = None
             
+        if self.scheduler:
+            self.scheduler.shutdown()
+            # Jobs still converting add to the held appends: let them finish before flushing those
+            if not self.scheduler.join(timeout=30):
+                self.log_message("Some images are still being processed; their notes are updated when they finish",
+                                 "WARNING")
+            self.scheduler = None
+        
+        for route in self.routes:
+            route.handler.flush_held_appends()
+            stats = route.handler.note_states.stats()
+            if stats['hits'] or stats['misses']:
+                self.log_message(f"Note cache ({route.name}): {stats['hits']} hits, {stats['misses']} misses, "
+                                 f"{stats['entries']} notes / {stats['bytes'] // 1024} KB cached", "INFO")
+            
         self.handler = None
+        self.dispatcher = None
+        self.routes = []
+        self.link_indexes = {}
         self.is_running = False
         self.start_button.config(text="🚀 Start Monitoring", style='Primary.TButton')
         self.status_badge.destroy()
@@ -495,6 +665,7 @@ class ImageProcessorGUI:
             
             # Add theme setting
             settings_dict['dark_theme'] = self.theme.is_dark_mode
+            settings_dict['routes'] = self.route_configs
             
             success, message = SettingsManager.save_settings(settings_dict, note_commands_dict)
             
@@ -524,6 +695,8 @@ class ImageProcessorGUI:
                         if self.theme.is_dark_mode:
                             self.theme.toggle_theme()
                 
+                self.route_configs = settings_dict.get('routes', [])
+                
                 # Update settings variables
                 for key, value in settings_dict.items():
                     if key in self.settings and key != 'dark_theme':  # Skip dark_theme as it's handled above
@@ -551,11 +724,17 @@ def main():
     def on_closing():
         if app.is_running:
             if messagebox.askokcancel("Quit", "Monitoring is still running. Do you want to stop and exit?"):
+                app.recent_images_tab.thumbnails.shutdown()
                 app.stop_monitoring()
                 app.stop_global_hotkey()
+                app.stop_control_server()
+                app.stop_metrics_export()
                 root.destroy()
         else:
+            app.recent_images_tab.thumbnails.shutdown()
             app.stop_global_hotkey()
+            app.stop_control_server()
+            app.stop_metrics_export()
             root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from pathlib import Path
+
+
+PREFIX = 'image_processor_'
+
+# name -> (type, help); incrementing or collecting a name not listed here is a KeyError
+METRICS = {
+    'images_processed_total': ('counter', "Images whose code was added to a note or copied to the clipboard"),
+    'conversions_total': ('counter', "Images converted to JPG or WebP"),
+    'conversion_bytes_in_total': ('counter', "Bytes of source images converted"),
+    'conversion_bytes_out_total': ('counter', "Bytes of converted output written"),
+    'errors_total': ('counter', "Errors by processing stage"),
+    'note_scans_total': ('counter', "Full vault scans for the most recently modified note"),
+    'note_scan_seconds_total': ('counter', "Time spent in full vault scans"),
+    'note_scan_last_seconds': ('gauge', "Duration of the last full vault scan"),
+    'monitoring': ('gauge', "1 while the folders are being monitored"),
+    'queue_depth': ('gauge', "Images waiting, by lane (plus incoming, spilled to disk and retrying)"),
+    'note_cache_hits_total': ('counter', "Note state cache hits"),
+    'note_cache_misses_total': ('counter', "Note state cache misses"),
+    'note_cache_hit_ratio': ('gauge', "Note state cache hits / lookups"),
+    'stage_runs_total': ('counter', "Processing stage runs, by stage"),
+    'stage_seconds_total': ('counter', "Time spent per processing stage"),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _sample_name(name, labels):
+    if not labels:
+        return PREFIX + name
+    return PREFIX + name + '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+class Metrics:
+    """
+    Counters and gauges for a long session, rendered in the Prometheus text format. Values
+    updated as work happens are kept here; collectors (functions returning (name, labels, value)
+    samples) supply values that already live elsewhere, such as queue depth and cache statistics,
+    and are called only when the metrics are read.
+    """
+
+    def __init__(self):
+        self._values = {}  # (name, sorted label items) -> value
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        if name not in METRICS:
+            raise KeyError(f"unknown metric {name}")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, amount=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def add_collector(self, key, collect):
+        with self._lock:
+            self._collectors[key] = collect
+
+    def remove_collector(self, key):
+        with self._lock:
+            self._collectors.pop(key, None)
+
+    def samples(self):
+        """All current values as {(name, label items): value}, collectors included."""
+        with self._lock:
+            samples = dict(self._values)
+            collectors = list(self._collectors.values())
+        for collect in collectors:
+            for name, labels, value in collect():
+                samples[self._key(name, labels)] = value
+        return samples
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        by_name = {}
+        for (name, labels), value in self.samples().items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            if name not in by_name:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in sorted(by_name[name]):
+                lines.append(f"{_sample_name(name, labels)} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """One JSON-serializable snapshot: {'time': ..., 'metrics': {sample name: value}}."""
+        return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'metrics': {_sample_name(name, labels): value
+                            for (name, labels), value in sorted(self.samples().items())}}
+
+
+class MetricsFileExporter:
+    """
+    Appends a JSON snapshot of the metrics to a file every `interval` seconds, one line per
+    snapshot, so throughput can be graphed over a long session. The file is rotated like a log
+    (metrics.jsonl -> metrics.jsonl.1 ...) once it grows past max_bytes, keeping `backups` old files.
+    """
+
+    def __init__(self, metrics, path, interval=60, max_bytes=5 * 1024 * 1024, backups=3, log_callback=None):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.interval = max(1, interval)
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.log_callback = log_callback
+        self._stop = threading.Event()
+        self._thread = None
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-export', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the timer and write a last snapshot."""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        try:
+            self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.metrics.snapshot()) + '\n')
+        except OSError as e:
+            self.log(f"Could not write metrics to {self.path}: {e}", "WARNING")
+
+    def _rotate(self):
+        try:
+            if self.path.stat().st_size < self.max_bytes:
+                return
+        except FileNotFoundError:
+            return
+        for index in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{index}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{index + 1}"))
+        if self.backups:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
@@ -0,0 +1,76 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+class NoteState:
+    """
+    Parsed view of one version of a note: its content, note commands and per-prefix numbering.
+    For a large note read in bounded mode `content` is None and commands come from its first
+    block; `partial` stays True while the numbering comes from the note's tail only.
+    """
+
+    __slots__ = ('content', 'mtime_ns', 'size', 'commands', 'prefix_counts', 'highest_numbers', 'partial', 'nbytes')
+
+    def __init__(self, content, mtime_ns, size, commands, prefix_counts, highest_numbers, partial=False):
+        self.content = content
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.commands = commands
+        self.prefix_counts = prefix_counts  # prefix -> image codes using it, in order of first use
+        self.highest_numbers = highest_numbers  # prefix -> highest {prefix}_{n} in the note
+        self.partial = partial
+        self.nbytes = sys.getsizeof(content) + 64 * len(prefix_counts)
+
+
+class NoteStateCache:
+    """
+    LRU of NoteState per note path, for users who switch between several notes while capturing.
+    An entry is only used while the note's (mtime_ns, size) still match, so edits made in
+    Obsidian are never missed. Bounded by entry count and by memory (estimated from content size).
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024, max_entries=32):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()  # note path -> NoteState
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, note_path, mtime_ns, size):
+        """Cached state for this exact version of the note, or None (counted as a miss)."""
+        with self._lock:
+            state = self._items.get(note_path)
+            if state is not None and state.mtime_ns == mtime_ns and state.size == size:
+                self._items.move_to_end(note_path)
+                self.hits += 1
+                return state
+            if state is not None:
+                self._remove(note_path)
+            self.misses += 1
+            return None
+
+    def put(self, note_path, state):
+        with self._lock:
+            if note_path in self._items:
+                self._remove(note_path)
+            if state.nbytes > self.max_bytes:
+                return
+            self._items[note_path] = state
+            self._bytes += state.nbytes
+            while self._items and (self._bytes > self.max_bytes or len(self._items) > self.max_entries):
+                self._remove(next(iter(self._items)))
+
+    def _remove(self, note_path):
+        self._bytes -= self._items.pop(note_path).nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._items), 'bytes': self._bytes}
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from pathlib import Path
+
+from path_rules import NoteScanRules
+
+
+class MtimeNoteResolver:
+    """
+    Picks the most recently modified note in the vault. The last pick is reused until it is
+    invalidated or deleted; otherwise the vault is walked again.
+    """
+
+    def __init__(self, vault_path, options, log_callback=None, metrics=None):
+        self.vault_path = Path(vault_path)
+        self.options = options
+        self.log_callback = log_callback
+        self.metrics = metrics
+        self.rules = NoteScanRules.from_options(options)
+        self._cached_note_path = None
+        self._cached_note_mtime = 0
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def invalidate(self):
+        """Forget the last pick (after an append), so the next lookup walks the vault again."""
+        self._cached_note_path = None
+
+    def resolve(self):
+        # Check if we have a cached note and if it's still valid
+        if self._cached_note_path:
+            try:
+                # If the cached note is still the most recent, return it
+                if self._cached_note_path.stat().st_mtime_ns >= self._cached_note_mtime:
+                    self.log(f"Using cached note: {self._cached_note_path}", "DEBUG")
+                    return self._cached_note_path
+            except OSError:
+                # Cached file no longer exists, invalidate cache
+                self._cached_note_path = None
+
+        # Cache miss or invalid - do full search
+        self.log("Performing full note search (cache miss)", "DEBUG")
+
+        # Excluded folders (.git, .obsidian, .trash, note_scan_rules) are pruned, not descended into
+        stats = {}
+        started = time.perf_counter()
+        recent = self.rules.recent_notes(self.vault_path, 1, self.options.get('recursive', True), stats=stats)
+        if self.metrics is not None:
+            elapsed = time.perf_counter() - started
+            self.metrics.inc('note_scans_total')
+            self.metrics.inc('note_scan_seconds_total', elapsed)
+            self.metrics.set('note_scan_last_seconds', elapsed)
+        if not recent:
+            raise Exception(f"No markdown (.md) files found in vault")
+
+        self.log(f"Found {stats['notes']} markdown files in vault ({stats['folders_pruned']} folders pruned, "
+                 f"{stats['files_skipped']} notes excluded)", "INFO")
+
+        # The scan already has the winner's mtime: no second stat
+        latest_mtime, latest_note = recent[0]
+        latest_note = Path(latest_note)
+
+        # Update cache
+        self._cached_note_path = latest_note
+        self._cached_note_mtime = latest_mtime
+
+        self.log(f"Using most recently modified note: {latest_note}", "INFO")
+        return latest_note
+
+
+class WorkspaceNoteResolver:
+    """
+    Picks the note that is open in Obsidian, read from .obsidian/workspace.json (the active
+    markdown tab, else the most recently opened note). The answer is cached against the
+    workspace file's mtime, so a lookup is a single stat until Obsidian saves its layout again.
+    Falls back to `fallback` (the mtime strategy) when the vault has no usable workspace file.
+    Notes excluded by the scan rules are passed over here too, as are notes in subfolders when
+    `recursive` is off.
+    """
+
+    def __init__(self, vault_path, options, log_callback=None, metrics=None, fallback=None):
+        self.vault_path = Path(vault_path)
+        self.options = options
+        self.log_callback = log_callback
+        self.fallback = fallback or MtimeNoteResolver(vault_path, options, log_callback, metrics)
+        self.rules = NoteScanRules.from_options(options)
+        self.workspace_path = self.vault_path / '.obsidian' / 'workspace.json'
+        self._workspace_mtime = None
+        self._active_note = None
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def invalidate(self):
+        # The workspace mtime already tells when the open note may have changed
+        self.fallback.invalidate()
+
+    def resolve(self):
+        try:
+            mtime = os.stat(self.workspace_path).st_mtime_ns
+        except OSError:
+            return self.fallback.resolve()
+        if mtime != self._workspace_mtime:
+            try:
+                self._active_note = self._read_active_note()
+            except (OSError, ValueError) as e:
+                # Possibly caught mid-save: leave the mtime unrecorded so the next lookup reads it again
+                self.log(f"Could not read {self.workspace_path.name}: {e}", "WARNING")
+                return self.fallback.resolve()
+            self._workspace_mtime = mtime
+            if self._active_note is not None:
+                self.log(f"Using note open in Obsidian: {self._active_note}", "INFO")
+        if self._active_note is None:
+            return self.fallback.resolve()
+        return self._active_note
+
+    def _read_active_note(self):
+        with open(self.workspace_path, 'r', encoding='utf-8') as f:
+            workspace = json.load(f)
+        if not isinstance(workspace, dict):
+            return None
+
+        candidates = []
+        leaf = self._find_leaf(workspace, workspace.get('active'))
+        if leaf is not None:
+            state = leaf.get('state') or {}
+            if state.get('type') == 'markdown':
+                candidates.append((state.get('state') or {}).get('file'))
+        candidates.extend(workspace.get('lastOpenFiles') or ())
+
+        recursive = self.options.get('recursive', True)
+        for relative in candidates:
+            if not isinstance(relative, str) or not relative.endswith('.md') or self.rules.excludes_path(relative):
+                continue
+            if not recursive and '/' in relative:
+                continue  # workspace.json always uses '/' separators
+            note_path = self.vault_path / relative
+            if note_path.is_file():
+                return note_path
+        return None
+
+    @staticmethod
+    def _find_leaf(node, leaf_id):
+        """The layout node with id `leaf_id`, searched through the nested split/tabs tree."""
+        if not leaf_id:
+            return None
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                if node.get('id') == leaf_id and node.get('type') == 'leaf':
+                    return node
+                stack.extend(value for value in node.values() if isinstance(value, (dict, list)))
+            elif isinstance(node, list):
+                stack.extend(node)
+        return None
+
+
+NOTE_RESOLVERS = {
+    'workspace': WorkspaceNoteResolver,
+    'mtime': MtimeNoteResolver,
+}
+
+
+def create_note_resolver(vault_path, options, log_callback=None, metrics=None):
+    """Resolver for the note_resolver setting ('workspace' by default, 'mtime' for the old guess)."""
+    resolver_class = NOTE_RESOLVERS.get(options.get('note_resolver', 'workspace'), WorkspaceNoteResolver)
+    return resolver_class(vault_path, options, log_callback, metrics)
@@ -0,0 +1,125 @@
+import os
+import re
+import json
+import threading
+from pathlib import Path
+
+from path_rules import WatchFilter
+
+
+class NumberingRegistry:
+    """
+    Highest {prefix}_{n} number per prefix across a whole images folder, so a prefix used in
+    several notes keeps counting up instead of restarting at 1 in each of them. Seeded by one scan
+    of the folder (down to watch_depth) when no registry file exists, then kept in
+    `.image_numbering.json` in the folder, rewritten atomically on every allocation.
+    Prefixes are matched case-insensitively, as file names are on Windows and macOS.
+    """
+
+    FILE_NAME = '.image_numbering.json'
+    NAME_PATTERN = re.compile(r'^(.+)_(\d+)\.[^.]+$')
+    # Names from auto_numbering off end in a Unix timestamp; those do not count as numbers
+    MAX_NUMBER = 10 ** 9
+
+    def __init__(self, images_folder, options=None, log_callback=None):
+        self.images_folder = Path(images_folder)
+        self.path = self.images_folder / self.FILE_NAME
+        self.options = options or {}
+        self.log_callback = log_callback
+        self._highest = {}  # casefolded prefix -> highest number
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    @staticmethod
+    def _key(prefix):
+        return prefix.casefold()
+
+    def _load(self):
+        """Read the registry file, or seed it from the folder (first use only, under the lock)."""
+        self._loaded = True
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                highest = json.load(f)
+            self._highest = {self._key(prefix): int(number) for prefix, number in highest.items()}
+            return
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            self.log(f"Could not read {self.path.name} ({e}), rebuilding it", "WARNING")
+        self._highest = self._scan()
+        self.log(f"Numbering registry seeded with {len(self._highest)} prefixes from {self.images_folder}", "INFO")
+        self._save()
+
+    def _scan(self):
+        highest = {}
+        watch_filter = WatchFilter.from_options(self.images_folder, self.options)
+        stack = [str(self.images_folder)]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = os.scandir(folder)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        # Descend where a file inside would still be watched (depth and ignore globs)
+                        if watch_filter.allows(os.path.join(entry.path, '_')):
+                            stack.append(entry.path)
+                        continue
+                    match = self.NAME_PATTERN.match(entry.name)
+                    if match is None:
+                        continue
+                    number = int(match.group(2))
+                    if number < self.MAX_NUMBER:
+                        key = self._key(match.group(1))
+                        highest[key] = max(highest.get(key, 0), number)
+        return highest
+
+    def _save(self):
+        tmp_path = self.path.with_name(f"{self.path.name}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._highest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.log(f"Could not save {self.path.name}: {e}", "WARNING")
+
+    def allocate(self, prefix, floor=0, is_taken=None):
+        """
+        Next number for `prefix`: above both the registry and `floor` (the highest number in the
+        note), skipping numbers `is_taken(n)` reports as in use. The number is recorded before
+        it is returned, so concurrent callers never get the same one.
+        """
+        key = self._key(prefix)
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            number = max(self._highest.get(key, 0), floor) + 1
+            while is_taken is not None and is_taken(number):
+                number += 1
+            self._highest[key] = number
+            self._save()
+            return number
+
+    def record_name(self, filename):
+        """Count a {prefix}_{n} name given outside allocate() (e.g. a manual rename)."""
+        match = self.NAME_PATTERN.match(Path(filename).name)
+        if match is None or int(match.group(2)) >= self.MAX_NUMBER:
+            return
+        key = self._key(match.group(1))
+        number = int(match.group(2))
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            if number > self._highest.get(key, 0):
+                self._highest[key] = number
+                self._save()
@@ -0,0 +1,270 @@
+import os
+import re
+import time
+import heapq
+import fnmatch
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class WatchFilter:
+    """
+    Decides which files under a watched folder are processed: at most `max_depth` subfolders
+    deep (0 = the folder itself only) and not inside or matching any ignore glob.
+    Globs are compiled into one regex and checked against each path component.
+    """
+
+    def __init__(self, root, max_depth=0, ignore_globs=()):
+        self.root = os.path.normcase(os.path.abspath(root))
+        self.max_depth = max(0, int(max_depth))
+        globs = [glob for glob in ignore_globs if glob]
+        self._ignore = re.compile('|'.join(fnmatch.translate(glob) for glob in globs), re.IGNORECASE) if globs else None
+
+    @classmethod
+    def from_options(cls, root, options):
+        """Build from the watch_depth / watch_ignore settings; rendition folders are always ignored."""
+        globs = [glob.strip() for glob in options.get('watch_ignore', '').split(',')]
+        for key, default in (('preview_folder', '_previews'), ('web_folder', 'web')):
+            folder = options.get(key, default)
+            if folder and not os.path.isabs(folder):
+                globs.append(folder)
+        return cls(root, options.get('watch_depth', 0), globs)
+
+    @property
+    def recursive(self):
+        return self.max_depth > 0
+
+    def relative_parts(self, path):
+        """Path components below the root, or None if the path is not under it."""
+        rel = os.path.relpath(os.path.normcase(os.path.abspath(path)), self.root)
+        if rel.startswith(os.pardir):
+            return None
+        return rel.split(os.sep)
+
+    def allows(self, path):
+        parts = self.relative_parts(path)
+        if parts is None or len(parts) - 1 > self.max_depth:
+            return False
+        if self._ignore is not None:
+            return not any(self._ignore.match(part) for part in parts)
+        return True
+
+
+class RecentFiles:
+    """
+    Recently seen files, to drop duplicate watcher events. Files are keyed by physical identity
+    (device, inode, size, mtime) in an LRU with a TTL, so a second event for the same file is
+    dropped wherever the first one sits in the queue, while a file moved to a new name after its
+    first event (rename-based savers) is still let through once. Paths the app writes itself
+    (conversions, renames) are remembered too and never picked up as new images.
+    """
+
+    def __init__(self, ttl=10, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._seen = OrderedDict()  # identity -> (path key, last seen), least recent first
+        self._own = OrderedDict()  # path key -> time written
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    @staticmethod
+    def identity(path):
+        st = os.stat(path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _expire(self, now):
+        while self._seen and now - next(iter(self._seen.values()))[1] >= self.ttl:
+            self._seen.popitem(last=False)
+        while self._own and now - next(iter(self._own.values())) >= self.ttl:
+            self._own.popitem(last=False)
+
+    def mark_own(self, path):
+        """Remember a path the app is about to write or rename a file to."""
+        with self._lock:
+            key = self._key(path)
+            self._own[key] = time.monotonic()
+            self._own.move_to_end(key)
+            while len(self._own) > self.max_entries:
+                self._own.popitem(last=False)
+
+    def is_new(self, path):
+        """True the first time a file is seen; False for repeats and for the app's own output."""
+        key = self._key(path)
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            if key in self._own:
+                return False
+            try:
+                identity = self.identity(path)
+            except OSError:
+                return True  # gone already: let processing report it
+            seen = self._seen.get(identity)
+            if seen is not None and (seen[0] == key or os.path.exists(seen[0])):
+                self._seen[identity] = (seen[0], now)
+                self._seen.move_to_end(identity)
+                return False
+            self._seen[identity] = (key, now)
+            self._seen.move_to_end(identity)
+            while len(self._seen) > self.max_entries:
+                self._seen.popitem(last=False)
+            return True
+
+
+def _translate_glob(glob):
+    """gitignore-style glob -> regex: * and ? stay within one folder, ** crosses folders."""
+    out = []
+    i, n = 0, len(glob)
+    while i < n:
+        c = glob[i]
+        if c == '*':
+            if glob.startswith('**/', i):
+                out.append('(?:.*/)?')
+                i += 3
+                continue
+            if glob.startswith('**', i):
+                out.append('.*')
+                i += 2
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[' and glob.find(']', i + 1) != -1:
+            j = glob.find(']', i + 1)
+            body = glob[i + 1:j].replace('\\', '\\\\')
+            out.append('[' + ('^' + body[1:] if body.startswith('!') else body) + ']')
+            i = j + 1
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+class NoteScanRules:
+    """
+    gitignore-style include/exclude rules for the vault scan, compiled once into one regex for
+    folders and one for files. A rule without a slash matches a name at any depth, a leading
+    slash anchors it to the vault root, a trailing slash matches folders only and `!` re-includes.
+    Later rules win. Excluded folders are pruned whole, so nothing below them is listed.
+    """
+
+    BASE_RULES = ('.git/', '.obsidian/', '.trash/')
+
+    def __init__(self, rules=()):
+        dir_parts, file_parts = [], []
+        # The alternation stops at the first rule that matches, so the last rule goes first
+        for index, rule in reversed(list(enumerate(rules))):
+            rule = rule.strip()
+            if not rule or rule.startswith('#'):
+                continue
+            include = rule.startswith('!')
+            rule = rule.lstrip('!')
+            dir_only = rule.endswith('/')
+            rule = rule.rstrip('/')
+            anchored = '/' in rule
+            rule = rule.lstrip('/')
+            if not rule:
+                continue
+            part = f"(?P<{'i' if include else 'x'}{index}>{'' if anchored else '(?:.*/)?'}{_translate_glob(rule)})"
+            dir_parts.append(part)
+            if not dir_only:
+                file_parts.append(part)
+        self._dir_pattern = re.compile('|'.join(dir_parts), re.IGNORECASE) if dir_parts else None
+        self._file_pattern = re.compile('|'.join(file_parts), re.IGNORECASE) if file_parts else None
+
+    @classmethod
+    def from_options(cls, options):
+        """Base rules, then the comma-separated note_scan_rules setting, then skip_excalidraw."""
+        rules = list(cls.BASE_RULES)
+        rules.extend(options.get('note_scan_rules', '').split(','))
+        if options.get('skip_excalidraw', True):
+            rules.append('*.excalidraw.md')
+        return cls(rules)
+
+    def excludes(self, rel_path, is_dir=False):
+        """Whether a vault-relative, '/'-separated path is excluded by the rules themselves."""
+        pattern = self._dir_pattern if is_dir else self._file_pattern
+        match = pattern.fullmatch(rel_path) if pattern is not None else None
+        return match is not None and match.lastgroup[0] == 'x'
+
+    def excludes_path(self, rel_path):
+        """Like excludes() for a file, but also true when any folder above it is excluded."""
+        parts = rel_path.split('/')
+        for depth in range(1, len(parts)):
+            if self.excludes('/'.join(parts[:depth]), is_dir=True):
+                return True
+        return self.excludes(rel_path)
+
+    def _scan_folder(self, path, prefix, k, recursive, subfolders=None):
+        """
+        Top-k (mtime_ns, path) notes below one folder, walked with os.scandir so each entry's
+        type comes from the directory listing and is never looked up again. With a `subfolders`
+        list, the folder's own subfolders are collected there instead of being descended into.
+        Returns (heap, folders_pruned, files_skipped, notes_seen).
+        """
+        heap = []
+        folders_pruned = files_skipped = notes_seen = 0
+        stack = [(path, prefix)]
+        while stack:
+            path, prefix = stack.pop()
+            try:
+                entries = os.scandir(path)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        # Like os.walk: symlinked folders are not descended into
+                        if not recursive or entry.is_symlink():
+                            continue
+                        if self.excludes(prefix + name, is_dir=True):
+                            folders_pruned += 1
+                        else:
+                            (stack if subfolders is None else subfolders).append((entry.path, prefix + name + '/'))
+                        continue
+                    if not name.endswith('.md'):
+                        continue
+                    if self.excludes(prefix + name):
+                        files_skipped += 1
+                        continue
+                    try:
+                        mtime = entry.stat().st_mtime_ns
+                    except OSError:
+                        continue
+                    notes_seen += 1
+                    if len(heap) < k:
+                        heapq.heappush(heap, (mtime, entry.path))
+                    elif mtime > heap[0][0]:
+                        heapq.heapreplace(heap, (mtime, entry.path))
+        return heap, folders_pruned, files_skipped, notes_seen
+
+    def recent_notes(self, root, k=1, recursive=True, max_workers=None, stats=None):
+        """
+        The k most recently modified notes under root the rules allow, newest first, as
+        (mtime_ns, path) pairs. Top-level subfolders are scanned on a thread pool, which pays off
+        most on network and cloud-synced drives where each listing waits on I/O. If `stats` is a
+        dict it receives 'notes', 'folders_pruned' and 'files_skipped' counts.
+        """
+        root = os.path.abspath(root)
+        subfolders = []
+        results = [self._scan_folder(root, '', k, recursive, subfolders)]
+        if subfolders:
+            max_workers = max_workers or min(8, (os.cpu_count() or 2) * 2)
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='vault-scan') as pool:
+                results.extend(pool.map(lambda folder: self._scan_folder(folder[0], folder[1], k, True), subfolders))
+        best = heapq.nlargest(k, (item for heap, *_ in results for item in heap))
+        if stats is not None:
+            stats['folders_pruned'] = sum(result[1] for result in results)
+            stats['files_skipped'] = sum(result[2] for result in results)
+            stats['notes'] = sum(result[3] for result in results)
+        return best
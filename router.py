@@ -0,0 +1,97 @@
+import os
+import re
+import fnmatch
+from pathlib import Path
+
+from watchdog.events import FileSystemEventHandler
+
+from path_rules import WatchFilter
+
+
+class Route:
+    """One watched folder (optionally narrowed by a filename pattern) and the handler serving it."""
+
+    def __init__(self, name, watch_folder, handler, pattern='*', overrides=None):
+        self.name = name
+        self.watch_folder = Path(watch_folder)
+        self.handler = handler
+        self.pattern = pattern or '*'
+        self.overrides = overrides or {}
+        self.watch_filter = WatchFilter.from_options(watch_folder, handler.options)
+
+
+def route_settings(base_options, route_config):
+    """
+    Merge one routes entry from settings.json over the main settings.
+    Returns (options, vault_path, default_prefix).
+    """
+    options = dict(base_options)
+    options.update(route_config.get('options', {}))
+    if route_config.get('watch_folder'):
+        options['images_folder'] = route_config['watch_folder']
+    if route_config.get('note'):
+        options['target_note'] = route_config['note']
+    vault_path = route_config.get('vault_path') or base_options.get('vault_path')
+    prefix = route_config.get('prefix') or base_options.get('default_prefix')
+    return options, vault_path, prefix
+
+
+class RouteDispatcher(FileSystemEventHandler):
+    """
+    Single event handler for every route. Scheduled once per watched folder on one Observer;
+    each event is routed by a dict lookup on its folder (walking up at most the deepest
+    watch_depth) and one precompiled regex per folder (all of that folder's patterns as a
+    named-group alternation, first route wins). Moves are routed by their destination.
+    Directory events are dropped before any lookup.
+    """
+
+    def __init__(self, routes):
+        self.routes = list(routes)
+        by_folder = {}
+        for route in self.routes:
+            by_folder.setdefault(self._folder_key(route.watch_folder), []).append(route)
+        self._by_folder = {}
+        for folder, folder_routes in by_folder.items():
+            alternation = '|'.join(f'(?P<r{i}>{fnmatch.translate(route.pattern)})'
+                                   for i, route in enumerate(folder_routes))
+            self._by_folder[folder] = (re.compile(alternation, re.IGNORECASE), folder_routes)
+        self._max_depth = max((route.watch_filter.max_depth for route in self.routes), default=0)
+
+    @staticmethod
+    def _folder_key(folder):
+        return os.path.normcase(os.path.abspath(folder))
+
+    def folders(self):
+        """Distinct (folder, recursive) pairs to schedule on the observer."""
+        return [(routes[0].watch_folder, any(route.watch_filter.recursive for route in routes))
+                for _, routes in self._by_folder.values()]
+
+    def route_for(self, path):
+        folder = os.path.dirname(path)
+        for _ in range(self._max_depth + 1):
+            entry = self._by_folder.get(self._folder_key(folder))
+            if entry is not None:
+                break
+            folder = os.path.dirname(folder)
+        else:
+            return None
+        pattern, routes = entry
+        match = pattern.match(os.path.basename(path))
+        if match is None:
+            return None
+        route = routes[int(match.lastgroup[1:])]
+        return route if route.watch_filter.allows(path) else None
+
+    def on_created(self, event):
+        if event.is_directory:
+            return
+        route = self.route_for(str(event.src_path))
+        if route is not None:
+            route.handler.on_created(event)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        route = self.route_for(str(event.dest_path))
+        if route is not None:
+            route.handler.on_moved(event)
@@ -11,6 +11,9 @@ class SettingsManager:
         return {
             'vault_path': '',
             'images_folder': '',
+            'watch_depth': 0,
+            'watch_ignore': '.*',
+            'subfolder_prefix_enabled': False,
             'default_prefix': 'Game',
             'override_prefix': '',
             'automatic_prefix_enabled': False,
@@ -20,17 +23,52 @@ class SettingsManager:
             'optimize_jpg': True,
             'bg_color': '#FFFFFF',
             'delete_original': True,
+            'max_image_memory_mb': 1024,
+            'oversize_policy': 'downscale',
+            'animated_policy': 'keep',
+            'preview_enabled': False,
+            'preview_max_size': 320,
+            'preview_folder': '_previews',
+            'web_variant_enabled': False,
+            'web_max_size': 1600,
+            'web_quality': 85,
+            'web_folder': 'web',
             'auto_rename': True,
             'auto_numbering': True,
+            'global_numbering': True,
             'add_to_note': True,
             'recursive': True,
             'skip_excalidraw': True,
+            'note_resolver': 'workspace',
+            'note_scan_rules': 'Templates/',
             'image_format': '[[File:{filename}]]',
             'separator': '',
             'clean_commands': False,
             'cooldown': 2.0,
+            'fast_lane_workers': 1,
+            'slow_lane_workers': 1,
+            'fast_lane_max_kb': 2048,
+            'queue_limit': 500,
+            'overload_policy': 'spill',
+            'retry_max_age': 120,
+            'dedup_ttl': 10,
+            'note_cache_mb': 8,
+            'note_cache_entries': 32,
+            'append_batch_ms': 250,
+            'gallery_window': 0,
+            'gallery_template': '> [!gallery] {count} images\n{images}',
+            'gallery_item': '> {image}',
+            'gallery_max_age': 60,
+            'gallery_max_items': 24,
+            'control_port': 0,
+            'metrics_file': '',
+            'metrics_interval': 60,
+            'metrics_file_mb': 5,
+            'large_note_kb': 1024,
+            'note_tail_kb': 256,
             'enable_note_commands': True,
             'clipboard_mode': False,
+            'thumbnail_memory_mb': 32,
             'dark_theme': False
         }
     
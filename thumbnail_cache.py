@@ -0,0 +1,118 @@
+import os
+import hashlib
+import threading
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class ThumbnailCache:
+    """
+    On-disk thumbnail cache keyed by image path, mtime and size.
+    Thumbnails are rendered on a small worker pool (never on the Tk thread) and stored as PNG,
+    so the GUI can load them with a plain tk.PhotoImage.
+    """
+
+    def __init__(self, cache_dir='.thumbnail_cache', max_workers=2):
+        self.cache_dir = Path(cache_dir)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='thumbnail')
+        self._pending = {}  # cache path -> Future, so concurrent requests share one render
+        self._lock = threading.Lock()
+
+    def cache_path(self, image_path, max_size):
+        """Cache file for this exact version of the image (changes when mtime or size change)."""
+        image_path = Path(image_path)
+        st = image_path.stat()
+        key = f"{image_path.resolve()}|{st.st_mtime_ns}|{st.st_size}|{max_size}"
+        return self.cache_dir / f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.png"
+
+    def request(self, image_path, max_size):
+        """
+        Return a Future resolving to the cached thumbnail path, or None if the image can't be read.
+        Cache hits resolve immediately without touching the worker pool.
+        """
+        try:
+            thumb_path = self.cache_path(image_path, max_size)
+        except OSError:
+            future = Future()
+            future.set_result(None)
+            return future
+
+        if thumb_path.exists():
+            future = Future()
+            future.set_result(thumb_path)
+            return future
+
+        with self._lock:
+            future = self._pending.get(thumb_path)
+            if future is None:
+                future = self._executor.submit(self._render, Path(image_path), thumb_path, max_size)
+                self._pending[thumb_path] = future
+                future.add_done_callback(lambda _f, key=thumb_path: self._forget(key))
+        return future
+
+    def _forget(self, thumb_path):
+        with self._lock:
+            self._pending.pop(thumb_path, None)
+
+    def _render(self, image_path, thumb_path, max_size):
+        """Worker: decode at reduced scale where supported, downscale and write atomically."""
+        try:
+            from PIL import Image
+            with Image.open(image_path) as img:
+                img.draft('RGB', (max_size, max_size))
+                img.thumbnail((max_size, max_size))
+                if img.mode not in ('RGB', 'RGBA'):
+                    img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = thumb_path.with_name(f"{thumb_path.name}.{threading.get_ident()}.tmp")
+                img.save(tmp_path, 'PNG')
+            os.replace(tmp_path, thumb_path)
+            return thumb_path
+        except Exception:
+            return None
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class PhotoImageLRU:
+    """
+    LRU of decoded tk.PhotoImage objects with a memory cap (estimated as width * height * 4 bytes).
+    Must only be used from the Tk thread.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # key -> (photo, nbytes)
+        self._bytes = 0
+
+    def get(self, key):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        self._items.move_to_end(key)
+        return item[0]
+
+    def put(self, key, photo):
+        """Store a photo and return the keys evicted to stay under the memory cap."""
+        if key in self._items:
+            self._bytes -= self._items.pop(key)[1]
+        nbytes = photo.width() * photo.height() * 4
+        self._items[key] = (photo, nbytes)
+        self._bytes += nbytes
+
+        evicted = []
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            old_key, (_, old_bytes) = self._items.popitem(last=False)
+            self._bytes -= old_bytes
+            evicted.append(old_key)
+        return evicted
+
+    def clear(self):
+        self._items.clear()
+        self._bytes = 0
+
+    @property
+    def memory_bytes(self):
+        return self._bytes
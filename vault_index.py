@@ -0,0 +1,320 @@
+import os
+import re
+import json
+import threading
+from pathlib import Path
+from urllib.parse import quote, unquote
+from concurrent.futures import ThreadPoolExecutor
+
+from watchdog.events import FileSystemEventHandler
+
+
+NOTE_SKIP_DIRS = {'.git', '.obsidian', '.trash'}
+NOTE_TEMP_SUFFIX = '.reindexing'
+NOTE_SUFFIXES = ('.md', '.canvas')  # canvases link files too, from file cards and text cards
+
+# Link targets inside a note: [[File:name.jpg|300]], ![[folder/name.png]], ![alt](folder/name%20x.png)
+_WIKI_TARGET = re.compile(r'\[\[([^\]|#\n]+)')
+_MARKDOWN_TARGET = re.compile(r'\]\(<?([^)>#\n]+)')
+_TARGET_SPLIT = re.compile(r'[/\\:]')
+
+
+def reference_pattern(names, image_format=None):
+    """
+    Regex matching any of `names` only where it is delimited like a link target
+    ([[name]], [[File:name|x]], ![](folder/name), ![](<folder/name>)), so substrings of longer
+    names are left alone.
+    With an image_format, the characters around its {filename} (the quotes of
+    '<img src="{filename}">') count as delimiters too.
+    """
+    alternation = '|'.join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    left, right = r'\[/:(<\\', r'\]|)#>'
+    before, placeholder, after = (image_format or '').partition('{filename}')
+    if placeholder:
+        left += re.escape(before[-1]) if before else r'\s'
+        right += re.escape(after[0]) if after else r'\s'
+    # Nothing around {filename}: the name may also start or end the note
+    start = f'(?<![^{left}])' if placeholder and not before else f'(?<=[{left}])'
+    end = f'(?![^{right}])' if placeholder and not after else f'(?=[{right}])'
+    return re.compile(start + '(' + alternation + ')' + end)
+
+
+def link_forms(renames):
+    """
+    {old name: new name} extended with the URL-encoded spellings markdown links use
+    (![](a%20b.png)), each mapped to the new name encoded the same way.
+    """
+    forms = dict(renames)
+    for old_name, new_name in renames.items():
+        for encode in (lambda name: name.replace(' ', '%20'), quote):
+            forms.setdefault(encode(old_name), encode(new_name))
+    return forms
+
+
+def format_pattern(image_format):
+    """
+    Regex for the configured image_format (e.g. '[[File:{filename}]]' or '<img src="{filename}">'),
+    so links written in a custom format are indexed too. None if the format has nothing around
+    {filename} to anchor on.
+    """
+    before, placeholder, after = image_format.partition('{filename}')
+    if not placeholder or not (before or after):
+        return None
+    stop = re.escape(after[0]) if after else r'\s'
+    return re.compile(re.escape(before) + r'([^\n' + stop + r']+)' + re.escape(after))
+
+
+def extract_link_names(content, extra_patterns=()):
+    """Basenames of every file (non-note) link target in a note."""
+    names = set()
+    for pattern in (_WIKI_TARGET, _MARKDOWN_TARGET, *extra_patterns):
+        # Notes often repeat the same embed; normalise each distinct target once
+        for target in set(pattern.findall(content)):
+            target = target.split('|', 1)[0].split('#', 1)[0]
+            if pattern is _MARKDOWN_TARGET:
+                target = unquote(target)
+            name = _TARGET_SPLIT.split(target)[-1].strip()
+            stem, dot, ext = name.rpartition('.')
+            if stem and dot and ext and ext.lower() != 'md':
+                names.add(name)
+    return names
+
+
+def extract_canvas_link_names(content, extra_patterns=()):
+    """Basenames of the files a canvas shows as file cards or links from its text cards."""
+    try:
+        canvas = json.loads(content)
+    except ValueError:
+        return set()
+    names = set()
+    nodes = canvas.get('nodes') if isinstance(canvas, dict) else None
+    for node in nodes if isinstance(nodes, list) else ():
+        if not isinstance(node, dict):
+            continue
+        if node.get('type') == 'file' and isinstance(node.get('file'), str):
+            name = node['file'].rsplit('/', 1)[-1]
+            stem, dot, ext = name.rpartition('.')
+            if stem and dot and ext and ext.lower() != 'md':
+                names.add(name)
+        elif node.get('type') == 'text' and isinstance(node.get('text'), str):
+            names |= extract_link_names(node['text'], extra_patterns)
+    return names
+
+
+class VaultLinkIndex:
+    """
+    Inverted index from file name to the notes that link to it.
+    Built once with a parallel scan of the vault, then kept current note-by-note by
+    VaultIndexHandler, so renames only have to read the notes that actually reference a file.
+    """
+
+    def __init__(self, vault_path, image_format=None, max_workers=None, log_callback=None):
+        self.vault_path = Path(vault_path)
+        self.image_format = image_format
+        custom = format_pattern(image_format) if image_format else None
+        self._extra_patterns = (custom,) if custom else ()
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 2) * 2)
+        self.log_callback = log_callback
+        self.ready = threading.Event()
+        self._by_name = {}  # file name -> set of note paths
+        self._by_note = {}  # note path -> set of file names
+        self._touched = set()  # notes updated by the watcher while a build is running
+        self._indexed = {}  # note path -> (mtime_ns, size) of the version last indexed
+        self._building = False
+        self._lock = threading.Lock()
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def iter_notes(self):
+        for dirpath, dirs, files in os.walk(self.vault_path):
+            dirs[:] = [d for d in dirs if d not in NOTE_SKIP_DIRS]
+            for name in files:
+                if name.endswith(NOTE_SUFFIXES):
+                    yield Path(dirpath) / name
+
+    def _read_links(self, note_path):
+        extract = extract_canvas_link_names if note_path.suffix == '.canvas' else extract_link_names
+        try:
+            with open(note_path, 'r', encoding='utf-8') as f:
+                return note_path, extract(f.read(), self._extra_patterns)
+        except (OSError, UnicodeDecodeError):
+            return note_path, None
+
+    def _read_chunk(self, note_paths):
+        return [self._read_links(note_path) for note_path in note_paths]
+
+    def build(self):
+        """Scan every note in the vault on a thread pool. Safe to run while the watcher is live."""
+        with self._lock:
+            self._building = True
+            self._touched.clear()
+        notes = list(self.iter_notes())
+        # Hand out notes in chunks: one future per note costs more than reading a small note
+        chunk_size = max(64, len(notes) // (self.max_workers * 4) + 1)
+        chunks = [notes[i:i + chunk_size] for i in range(0, len(notes), chunk_size)]
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='vault-index') as pool:
+            results = [result for chunk in pool.map(self._read_chunk, chunks) for result in chunk]
+
+        with self._lock:
+            for note_path, names in results:
+                # The watcher's copy is newer than what the scan read
+                if names is not None and note_path not in self._touched:
+                    self._set_note(note_path, names)
+            self._building = False
+            self._touched.clear()
+            linked = len(self._by_name)
+        self.ready.set()
+        self.log(f"Indexed {len(notes)} notes ({linked} linked files)", "DEBUG")
+        return len(notes)
+
+    def build_async(self):
+        thread = threading.Thread(target=self.build, daemon=True)
+        thread.start()
+        return thread
+
+    def _set_note(self, note_path, names):
+        old_names = self._by_note.get(note_path, set())
+        for name in old_names - names:
+            notes = self._by_name.get(name)
+            if notes is not None:
+                notes.discard(note_path)
+                if not notes:
+                    del self._by_name[name]
+        for name in names - old_names:
+            self._by_name.setdefault(name, set()).add(note_path)
+        if names:
+            self._by_note[note_path] = names
+        else:
+            self._by_note.pop(note_path, None)
+
+    @staticmethod
+    def _version(note_path):
+        try:
+            st = note_path.stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def update_note(self, note_path):
+        note_path = Path(note_path)
+        version = self._version(note_path)  # before reading: a write in between is picked up next time
+        note_path, names = self._read_links(note_path)
+        if names is None:
+            return
+        with self._lock:
+            if self._building:
+                self._touched.add(note_path)
+            self._set_note(note_path, names)
+            self._indexed[note_path] = version
+
+    def note_modified(self, note_path):
+        """
+        Watcher event for a note: re-read it unless this version is already indexed, as it is
+        after the app's own appends (note_appended), so those never cost a full read.
+        """
+        note_path = Path(note_path)
+        version = self._version(note_path)
+        with self._lock:
+            if version is not None and self._indexed.get(note_path) == version:
+                return
+        self.update_note(note_path)
+
+    def note_appended(self, note_path, text):
+        """Add the links in text just appended to a note, without re-reading the whole note."""
+        names = extract_link_names(text, self._extra_patterns)
+        note_path = Path(note_path)
+        version = self._version(note_path)
+        with self._lock:
+            if self._building:
+                self._touched.add(note_path)
+            if names:
+                self._set_note(note_path, self._by_note.get(note_path, set()) | names)
+            # Only the appended text was indexed: trust it only if the rest was indexed before
+            if note_path in self._by_note or not self._building:
+                self._indexed[note_path] = version
+
+    def remove_note(self, note_path):
+        note_path = Path(note_path)
+        with self._lock:
+            if self._building:
+                self._touched.add(note_path)
+            self._set_note(note_path, set())
+            self._indexed.pop(note_path, None)
+
+    def notes_referencing(self, name):
+        with self._lock:
+            return sorted(self._by_name.get(name, ()))
+
+    def linked_names(self):
+        with self._lock:
+            return set(self._by_name)
+
+    def rename_references(self, renames):
+        """
+        Rewrite links to renamed files ({old name: new name}) in every note that references them.
+        Only notes listed in the index are read. Returns the list of notes that were changed.
+        """
+        if not renames:
+            return []
+        with self._lock:
+            notes = set()
+            for old_name in renames:
+                notes.update(self._by_name.get(old_name, ()))
+        if not notes:
+            return []
+
+        forms = link_forms(renames)
+        pattern = reference_pattern(forms, self.image_format)
+        # In a canvas, a file card's path is a JSON string: "images/name.jpg"
+        canvas_pattern = reference_pattern(renames, '"{filename}"')
+        updated = []
+        for note_path in sorted(notes):
+            try:
+                with open(note_path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+                rename = canvas_pattern if note_path.suffix == '.canvas' else pattern
+                new_content, count = rename.subn(lambda m: forms[m.group(1)], content)
+                if count:
+                    tmp_path = note_path.with_name(note_path.name + NOTE_TEMP_SUFFIX)
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        f.write(new_content)
+                    os.replace(tmp_path, note_path)
+                    updated.append(note_path)
+            except (OSError, UnicodeDecodeError) as e:
+                self.log(f"Could not update links in {note_path.name}: {e}", "WARNING")
+                continue
+            self.update_note(note_path)
+        return updated
+
+
+class VaultIndexHandler(FileSystemEventHandler):
+    """Keeps a VaultLinkIndex in step with note (and canvas) edits, deletes and moves in the vault."""
+
+    def __init__(self, index):
+        self.index = index
+
+    @staticmethod
+    def _is_note(path):
+        return path.endswith(NOTE_SUFFIXES) and not any(part in NOTE_SKIP_DIRS for part in Path(path).parts)
+
+    def on_created(self, event):
+        if not event.is_directory and self._is_note(event.src_path):
+            self.index.update_note(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory and self._is_note(event.src_path):
+            self.index.note_modified(event.src_path)
+
+    def on_deleted(self, event):
+        if not event.is_directory and self._is_note(event.src_path):
+            self.index.remove_note(event.src_path)
+
+    def on_moved(self, event):
+        if event.is_directory:
+            return
+        if self._is_note(event.src_path):
+            self.index.remove_note(event.src_path)
+        if self._is_note(event.dest_path):
+            self.index.update_note(event.dest_path)
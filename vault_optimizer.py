@@ -0,0 +1,337 @@
+"""
+Bulk re-optimizer for images that are already in the vault.
+
+Re-encodes JPGs saved at a higher quality than the target and converts other still images
+to JPG, using the same conversion code as the live ImageHandler. Work runs on a process pool;
+renames, note rewrites and the manifest are handled by the parent process only.
+
+The manifest is an append-only JSON-lines journal, so the run can be interrupted at any point
+and resumed: files whose content hash is already recorded are skipped, and conversions that
+were cut short between writing the JPG and rewriting note references are completed first.
+
+Usage:
+    python vault_optimizer.py --vault <vault> [--images <folder>] [--quality 85] [--workers N]
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from image_handler import ImageHandler
+from vault_index import VaultLinkIndex, NOTE_SKIP_DIRS
+
+
+TEMP_SUFFIX = '.optimizing'
+MANIFEST_NAME = '.image_optimizer_manifest.jsonl'
+
+# Standard JPEG luminance quantization table (quality 50), used to estimate a file's quality
+_STD_LUMINANCE = [
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99,
+]
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def estimate_jpeg_quality(img):
+    """Estimate the libjpeg quality setting from the luminance quantization table (None if unknown)."""
+    tables = getattr(img, 'quantization', None)
+    if not tables or 0 not in tables:
+        return None
+    table = list(tables[0])
+    scale = sum(table) * 100 / sum(_STD_LUMINANCE)
+    if scale <= 100:
+        return round((200 - scale) / 2)
+    return round(5000 / scale)
+
+
+# --- process pool worker -------------------------------------------------------------------
+
+_worker_state = {}
+
+
+def _init_worker(vault_path, options, done_hashes):
+    """Runs once per worker process: one ImageHandler (no worker thread) and the skip set."""
+    _worker_state['handler'] = ImageHandler(vault_path, 'Optimize', dict(options, async_processing=False))
+    _worker_state['done'] = done_hashes
+
+
+def _optimize_file(path_str, quality, min_savings):
+    """
+    Worker: write an optimized version of one image to a temp file next to its target.
+    Never touches the original or any note; the parent process commits the result.
+    """
+    from PIL import Image
+
+    handler = _worker_state['handler']
+    path = Path(path_str)
+    result = {'path': path_str, 'status': 'skipped', 'bytes_before': 0, 'bytes_after': 0}
+    try:
+        content_hash = file_hash(path)
+        result['hash'] = content_hash
+        result['bytes_before'] = result['bytes_after'] = path.stat().st_size
+        if content_hash in _worker_state['done']:
+            result['reason'] = 'already optimal'
+            return result
+
+        is_jpg = path.suffix.lower() in ('.jpg', '.jpeg')
+        target = path if is_jpg else path.with_suffix('.jpg')
+        tmp_path = target.with_name(target.name + TEMP_SUFFIX)
+
+        with Image.open(path) as source:
+            if handler._is_animated(source, path):
+                result['reason'] = 'animated'
+                return result
+            if is_jpg:
+                estimated = estimate_jpeg_quality(source)
+                if estimated is not None and estimated <= quality:
+                    result.update(reason=f'quality {estimated} <= {quality}', optimal=True)
+                    return result
+            bg_rgb = handler._parse_bg_color(handler.options.get('bg_color', '#FFFFFF'))
+            if not handler._write_jpg(source, path, tmp_path, quality, bg_rgb, keep_metadata=True):
+                result['reason'] = 'over memory ceiling'
+                return result
+
+        new_size = tmp_path.stat().st_size
+        if new_size > result['bytes_before'] * (1 - min_savings):
+            tmp_path.unlink()
+            result.update(reason='no meaningful savings', optimal=True)
+            return result
+
+        result.update(status='optimized', tmp=str(tmp_path), target=str(target),
+                      bytes_after=new_size, new_hash=file_hash(tmp_path))
+        return result
+    except Exception as e:
+        result.update(status='error', reason=str(e))
+        return result
+
+
+# --- parent process ------------------------------------------------------------------------
+
+class OptimizerManifest:
+    """
+    Append-only JSON-lines journal. Records:
+      {"op": "done", "hash": ..., "quality": ...}     content known to be optimal at that quality
+      {"op": "pending", "old": ..., "new": ...}       converted file written, references not yet rewritten
+      {"op": "committed", "old": ...}                 references rewritten and original removed
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = {}
+        self.pending = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from an interrupted write
+                    if record.get('op') == 'done':
+                        self.done[record['hash']] = record['quality']
+                    elif record.get('op') == 'pending':
+                        self.pending[record['old']] = record['new']
+                    elif record.get('op') == 'committed':
+                        self.pending.pop(record['old'], None)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _append(self, record, sync=False):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        if sync:
+            os.fsync(self._file.fileno())
+
+    def mark_done(self, content_hash, quality):
+        self.done[content_hash] = quality
+        self._append({'op': 'done', 'hash': content_hash, 'quality': quality})
+
+    def mark_pending(self, old, new):
+        # Must be durable before the converted file replaces anything on disk
+        self.pending[old] = new
+        self._append({'op': 'pending', 'old': old, 'new': new}, sync=True)
+
+    def mark_committed(self, old):
+        self.pending.pop(old, None)
+        self._append({'op': 'committed', 'old': old})
+
+    def done_hashes(self, quality):
+        return {h for h, q in self.done.items() if q <= quality}
+
+    def close(self):
+        self._file.close()
+
+
+class VaultOptimizer:
+    def __init__(self, vault_path, images_folder=None, quality=85, workers=None, options=None,
+                 manifest_path=None, min_savings=0.05, batch_size=200, log_callback=None):
+        self.vault_path = Path(vault_path)
+        self.images_folder = Path(images_folder) if images_folder else self.vault_path
+        self.quality = quality
+        self.workers = workers or os.cpu_count() or 2
+        self.options = dict(options or {})
+        self.min_savings = min_savings
+        self.batch_size = batch_size
+        self.log_callback = log_callback
+        self.logger = logging.getLogger(__name__)
+        self.manifest = OptimizerManifest(manifest_path or self.images_folder / MANIFEST_NAME)
+        self.stats = {'optimized': 0, 'converted': 0, 'skipped': 0, 'errors': 0,
+                      'notes_updated': 0, 'bytes_before': 0, 'bytes_after': 0}
+        self.link_index = VaultLinkIndex(self.vault_path, self.options.get('image_format'), log_callback=log_callback)
+        self._probe = ImageHandler(self.vault_path, 'Optimize', dict(self.options, async_processing=False))
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+        self.logger.log(getattr(logging, level, logging.INFO), message)
+
+    def _walk(self, root):
+        """os.walk without .git/.obsidian/.trash; removes temp files left by an interrupted run."""
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in NOTE_SKIP_DIRS]
+            for name in files:
+                if name.endswith(TEMP_SUFFIX):
+                    os.unlink(os.path.join(dirpath, name))
+                    continue
+                yield Path(dirpath) / name
+
+    def iter_images(self):
+        for path in self._walk(self.images_folder):
+            if self._probe.is_image_file(path):
+                yield path
+
+    def rewrite_references(self, renames):
+        """Rewrite embeds/links of old filenames to new filenames in the notes that reference them."""
+        if not renames:
+            return 0
+        if not self.link_index.ready.is_set():
+            self.link_index.build()
+        updated = len(self.link_index.rename_references(
+            {Path(old).name: Path(new).name for old, new in renames.items()}))
+        self.stats['notes_updated'] += updated
+        return updated
+
+    def _commit_conversions(self, batch):
+        """References first, originals last: a crash in between is repaired from the journal on resume."""
+        self.rewrite_references(batch)
+        for old in batch:
+            try:
+                Path(old).unlink()
+            except FileNotFoundError:
+                pass
+            self.manifest.mark_committed(old)
+        batch.clear()
+
+    def resume_pending(self):
+        """Finish conversions from an interrupted run whose JPG was written but not committed."""
+        if not self.manifest.pending:
+            return
+        self.log(f"Resuming {len(self.manifest.pending)} interrupted conversion(s)", "WARNING")
+        batch = {}
+        for old, new in list(self.manifest.pending.items()):
+            if Path(new).exists():
+                batch[old] = new
+            else:
+                self.manifest.mark_committed(old)  # interrupted before the JPG landed; redo normally
+        self._commit_conversions(batch)
+
+    def _handle_result(self, result, batch):
+        self.stats['bytes_before'] += result['bytes_before']
+        if result['status'] == 'optimized':
+            if self._commit_result(result, batch):
+                self.stats['bytes_after'] += result['bytes_after']
+                return
+            result['status'] = 'skipped'
+        self.stats['bytes_after'] += result['bytes_before']
+
+        if result['status'] == 'error':
+            self.stats['errors'] += 1
+            self.log(f"Could not optimize {result['path']}: {result.get('reason')}", "ERROR")
+            return
+        self.stats['skipped'] += 1
+        if result.get('optimal'):
+            self.manifest.mark_done(result['hash'], self.quality)
+
+    def _commit_result(self, result, batch):
+        """Move a worker's temp file into place. Returns False if it had to be discarded."""
+        path, target, tmp_path = result['path'], result['target'], result['tmp']
+        if path == target:
+            os.replace(tmp_path, target)  # same name, no reference changes
+            self.stats['optimized'] += 1
+        else:
+            if Path(target).exists():
+                os.unlink(tmp_path)
+                self.log(f"Skipping {Path(path).name}: {Path(target).name} already exists", "WARNING")
+                return False
+            self.manifest.mark_pending(path, target)
+            os.replace(tmp_path, target)
+            batch[path] = target
+            self.stats['converted'] += 1
+            if len(batch) >= self.batch_size:
+                self._commit_conversions(batch)
+        self.manifest.mark_done(result['new_hash'], self.quality)
+        return True
+
+    def run(self):
+        start = time.time()
+        self.resume_pending()
+
+        done = self.manifest.done_hashes(self.quality)
+        paths = [str(p) for p in self.iter_images()]
+        self.log(f"Optimizing {len(paths)} image(s) at quality {self.quality} with {self.workers} worker(s)", "INFO")
+
+        batch = {}
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(str(self.vault_path), self.options, done)) as pool:
+                futures = [pool.submit(_optimize_file, p, self.quality, self.min_savings) for p in paths]
+                for future in as_completed(futures):
+                    self._handle_result(future.result(), batch)
+        finally:
+            self._commit_conversions(batch)
+            self.manifest.close()
+
+        saved = self.stats['bytes_before'] - self.stats['bytes_after']
+        self.log(
+            f"Done in {time.time() - start:.1f}s: {self.stats['optimized']} re-encoded, "
+            f"{self.stats['converted']} converted, {self.stats['skipped']} skipped, {self.stats['errors']} errors, "
+            f"{self.stats['notes_updated']} notes updated, saved {saved / (1024 * 1024):.1f} MB", "SUCCESS")
+        return self.stats
+
+
+def main():
+    from settings_manager import SettingsManager
+
+    _, settings, _, _ = SettingsManager.load_settings()
+    parser = argparse.ArgumentParser(description="Re-optimize images already in an Obsidian vault")
+    parser.add_argument('--vault', default=settings.get('vault_path'), help="vault to rewrite references in")
+    parser.add_argument('--images', default=settings.get('images_folder'),
+                        help="folder to optimize (default: images folder from settings.json, else the whole vault)")
+    parser.add_argument('--quality', type=int, default=85)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--min-savings', type=float, default=0.05,
+                        help="only keep results at least this fraction smaller (default 0.05)")
+    parser.add_argument('--manifest', default=None, help=f"journal path (default: <images>/{MANIFEST_NAME})")
+    args = parser.parse_args()
+    if not args.vault:
+        parser.error("--vault is required when settings.json has no vault_path")
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    optimizer = VaultOptimizer(args.vault, args.images or None, quality=args.quality, workers=args.workers,
+                               options=settings, manifest_path=args.manifest, min_savings=args.min_savings)
+    optimizer.run()
+
+
+if __name__ == '__main__':
+    main()
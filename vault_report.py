@@ -0,0 +1,121 @@
+"""
+Orphan and broken-link report for an Obsidian vault.
+
+Orphans are images in the images folder that no note or canvas links to. Broken links are image
+codes in notes whose file no longer exists anywhere in the vault. Both are worked out from one
+VaultLinkIndex scan, and results are printed as they are found.
+
+Usage:
+    python vault_report.py [--vault <vault>] [--images <folder>] [--trash [folder]]
+"""
+import os
+import argparse
+from pathlib import Path
+
+from image_handler import ImageHandler
+from vault_index import VaultLinkIndex, NOTE_SKIP_DIRS
+
+
+class VaultReport:
+    def __init__(self, vault_path, images_folder=None, options=None, log_callback=None):
+        self.vault_path = Path(vault_path)
+        self.images_folder = Path(images_folder) if images_folder else self.vault_path
+        self.options = dict(options or {})
+        self.index = VaultLinkIndex(self.vault_path, self.options.get('image_format'), log_callback=log_callback)
+        self._probe = ImageHandler(self.vault_path, 'Report', dict(self.options, async_processing=False))
+
+        # Rendition folders hold copies that are never linked directly
+        skip = set(NOTE_SKIP_DIRS)
+        for key, default in (('preview_folder', '_previews'), ('web_folder', 'web')):
+            folder = self.options.get(key, default)
+            if folder and not Path(folder).is_absolute():
+                skip.add(folder)
+        self._skip_dirs = skip
+
+    def _walk_files(self, root, skip_dirs):
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d not in skip_dirs]
+            for name in files:
+                yield dirpath, name
+
+    def iter_orphans(self):
+        """Yield images in the images folder that no note or canvas links to."""
+        if not self.index.ready.is_set():
+            self.index.build()
+        linked = self.index.linked_names()
+        for dirpath, name in self._walk_files(self.images_folder, self._skip_dirs):
+            if name not in linked and self._probe.is_image_file(Path(name)):
+                yield Path(dirpath) / name
+
+    def iter_broken_links(self):
+        """Yield (file name, [notes]) for image links whose file exists nowhere in the vault."""
+        if not self.index.ready.is_set():
+            self.index.build()
+        roots = [self.vault_path]
+        if self.images_folder != self.vault_path and self.vault_path not in self.images_folder.parents:
+            roots.append(self.images_folder)
+        existing = {name for root in roots for _, name in self._walk_files(root, NOTE_SKIP_DIRS)}
+        for name in sorted(self.index.linked_names() - existing):
+            if self._probe.is_image_file(Path(name)):
+                yield name, self.index.notes_referencing(name)
+
+    def move_to_trash(self, paths, trash_folder=None):
+        """
+        Move files into trash_folder (default: the vault's .trash, which Obsidian also uses),
+        keeping both copies if a file of the same name is already there. Returns the number moved.
+        """
+        trash = Path(trash_folder) if trash_folder else self.vault_path / '.trash'
+        trash.mkdir(parents=True, exist_ok=True)
+        taken = {entry.name for entry in os.scandir(trash)}
+        moved = 0
+        for path in paths:
+            target_name = path.name
+            counter = 1
+            while target_name in taken:
+                target_name = f"{path.stem} ({counter}){path.suffix}"
+                counter += 1
+            try:
+                os.replace(path, trash / target_name)
+            except OSError:
+                continue
+            taken.add(target_name)
+            moved += 1
+        return moved
+
+
+def main():
+    from settings_manager import SettingsManager
+
+    _, settings, _, _ = SettingsManager.load_settings()
+    parser = argparse.ArgumentParser(description="Report orphaned images and broken image links in a vault")
+    parser.add_argument('--vault', default=settings.get('vault_path'))
+    parser.add_argument('--images', default=settings.get('images_folder'),
+                        help="folder to check for orphans (default: images folder from settings.json, else the vault)")
+    parser.add_argument('--trash', nargs='?', const='', default=None, metavar='FOLDER',
+                        help="move orphans to FOLDER (default: <vault>/.trash)")
+    args = parser.parse_args()
+    if not args.vault:
+        parser.error("--vault is required when settings.json has no vault_path")
+
+    report = VaultReport(args.vault, args.images or None, options=settings)
+    orphans = []
+    print("Orphaned images:")
+    for path in report.iter_orphans():
+        orphans.append(path)
+        print(f"  {path}")
+    print(f"{len(orphans)} orphaned image(s)")
+
+    broken = 0
+    print("Broken image links:")
+    for name, notes in report.iter_broken_links():
+        broken += 1
+        print(f"  {name}  <- {', '.join(note.name for note in notes)}")
+    print(f"{broken} broken link(s)")
+
+    if args.trash is not None and orphans:
+        moved = report.move_to_trash(orphans, args.trash or None)
+        print(f"Moved {moved} orphaned image(s) to {args.trash or Path(args.vault) / '.trash'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,606 @@
+import os
+import json
+import time
+import heapq
+import itertools
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+from collections import deque, namedtuple
+
+from metrics import Metrics
+
+
+LANES = ('fast', 'slow')
+OVERLOAD_POLICIES = ('block', 'spill', 'drop_oldest')
+
+
+class SpillJournal:
+    """
+    FIFO of overflow paths in an append-only JSON-lines file. Reads advance an offset, saved next
+    to the journal ({name}.offset) so entries taken before a stop or crash are not queued again,
+    and both files are removed once the journal is fully drained.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.offset_path = self.path.with_name(self.path.name + '.offset')
+        self._read_offset = 0
+        self.count = 0
+        if self.path.exists():
+            try:
+                self._read_offset = int(self.offset_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                self._read_offset = 0
+            if self._read_offset > self.path.stat().st_size:
+                self._read_offset = 0  # the journal was replaced since the offset was saved
+            with open(self.path, 'r', encoding='utf-8') as f:
+                f.seek(self._read_offset)
+                self.count = sum(1 for line in f if line.strip())
+        else:
+            try:
+                os.unlink(self.offset_path)  # left over from a journal that no longer exists
+            except FileNotFoundError:
+                pass
+
+    def append(self, path):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'path': str(path)}) + '\n')
+        self.count += 1
+
+    def pop(self, limit):
+        """Up to `limit` paths, oldest first."""
+        if not self.count:
+            return []
+        paths = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.seek(self._read_offset)
+            while len(paths) < limit:
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    paths.append(Path(json.loads(line)['path']))
+                except (ValueError, KeyError):
+                    pass  # torn line from a crash mid-write
+            self._read_offset = f.tell()
+            drained = not f.readline()
+        self.count = 0 if drained else max(0, self.count - len(paths))
+        if drained:
+            self._read_offset = 0
+            os.unlink(self.path)
+            try:
+                os.unlink(self.offset_path)
+            except FileNotFoundError:
+                pass
+        else:
+            self._save_offset()
+        return paths
+
+    def _save_offset(self):
+        tmp_path = self.offset_path.with_name(self.offset_path.name + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(str(self._read_offset))
+        os.replace(tmp_path, self.offset_path)
+
+
+Ticket = namedtuple('Ticket', 'note_path seq')
+
+
+class NoteSequencer:
+    """
+    Keeps appends to a note in capture order while images are processed in parallel.
+    A ticket is taken when the image is queued. A job whose conversion finishes before an earlier
+    capture for the same note parks its append here instead of blocking a worker; the append runs
+    as soon as every earlier ticket for that note is released. Other notes are never held back.
+    """
+
+    def __init__(self, log_callback=None):
+        self.log_callback = log_callback
+        self._seq = 0
+        self._waiting = {}  # note path -> deque of outstanding seqs, oldest first
+        self._parked = {}  # seq -> append waiting for its turn
+        self._lock = threading.Lock()
+
+    def ticket(self, note_path):
+        with self._lock:
+            self._seq += 1
+            self._waiting.setdefault(note_path, deque()).append(self._seq)
+            return Ticket(note_path, self._seq)
+
+    def run_in_turn(self, ticket, action):
+        """Run action() now if no earlier ticket for the note is outstanding, else park it."""
+        with self._lock:
+            queue = self._waiting.get(ticket.note_path)
+            if queue and queue[0] != ticket.seq and ticket.seq in queue:
+                self._parked[ticket.seq] = action
+                return False
+        action()
+        return True
+
+    def outstanding(self, note_path):
+        """Tickets for the note not yet released (queued, converting or waiting to append)."""
+        with self._lock:
+            return len(self._waiting.get(note_path, ()))
+
+    def release(self, ticket):
+        """
+        Mark a ticket done (finished, failed or dropped), then run any parked appends whose turn
+        has come. A parked ticket stays outstanding until its append has run.
+        """
+        while True:
+            with self._lock:
+                if ticket.seq in self._parked:
+                    return
+                queue = self._waiting.get(ticket.note_path)
+                if queue is None or ticket.seq not in queue:
+                    return
+                queue.remove(ticket.seq)
+                if not queue:
+                    del self._waiting[ticket.note_path]
+                    return
+                action = self._parked.pop(queue[0], None)
+                if action is None:
+                    return
+                ticket = Ticket(ticket.note_path, queue[0])
+            # The next capture for this note already finished converting: append it now
+            try:
+                action()
+            except Exception as e:
+                if self.log_callback:
+                    self.log_callback(f"Deferred append failed: {e}", "ERROR")
+
+
+class RetryQueue:
+    """
+    Delayed retries for steps that failed because another process still held the file
+    (PermissionError from an antivirus scanner, a sync client or the capture tool itself).
+    Each retry waits twice as long as the one before, up to `max_delay`, and a step is given up
+    once it has been failing for its max_age. Retries run on one timer thread started on first
+    use, so workers never sleep on a locked file.
+    """
+
+    def __init__(self, log_callback=None, base_delay=0.5, max_delay=30, metrics=None):
+        self.log_callback = log_callback
+        self.metrics = metrics
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._heap = []  # (due, order, entry)
+        self._order = itertools.count()
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def __len__(self):
+        with self._changed:
+            return len(self._heap)
+
+    def schedule(self, description, action, on_give_up=None, max_age=120):
+        """
+        Call action() again later until it stops raising PermissionError. on_give_up(error) runs
+        instead once the step has been failing for max_age seconds.
+        """
+        entry = {'description': description, 'action': action, 'on_give_up': on_give_up,
+                 'max_age': max_age, 'first_failure': time.monotonic(), 'attempts': 1}
+        self.log(f"{description}: file is in use, retrying in {self.base_delay:g}s", "WARNING")
+        self._push(entry, self.base_delay)
+
+    def _push(self, entry, delay):
+        with self._changed:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._order), entry))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='retry-queue', daemon=True)
+                self._thread.start()
+            self._changed.notify()
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    self._changed.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                _, _, entry = heapq.heappop(self._heap)
+            self._attempt(entry)
+
+    def _attempt(self, entry):
+        description = entry['description']
+        try:
+            entry['action']()
+        except PermissionError as e:
+            if time.monotonic() - entry['first_failure'] >= entry['max_age']:
+                self.log(f"{description}: still in use after {entry['attempts']} attempts, giving up ({e})", "ERROR")
+                if self.metrics is not None:
+                    self.metrics.inc('errors_total', stage='retry')
+                if entry['on_give_up']:
+                    try:
+                        entry['on_give_up'](e)
+                    except Exception as give_up_error:
+                        self.log(f"{description}: {give_up_error}", "ERROR")
+                return
+            delay = min(self.max_delay, self.base_delay * 2 ** entry['attempts'])
+            entry['attempts'] += 1
+            self._push(entry, delay)
+        except Exception as e:
+            self.log(f"{description}: retry failed: {e}", "ERROR")
+        else:
+            self.log(f"{description}: succeeded after {entry['attempts'] + 1} attempts", "INFO")
+
+
+class NoteWriter:
+    """
+    Write-combining buffer for note appends. Appends to a note are held (add) while more images
+    for it are still on their way, and written together by whoever takes the batch (take) under
+    the note lock: the last image of a burst, or on_due(note_path) from the timer thread once
+    the first held append is `window` seconds old. One write, one cache refresh and one Obsidian
+    reload per burst instead of one per image. With a `delay`, add() pushes the deadline back to
+    `delay` seconds after the latest item instead (gallery grouping), but never past `max_age`
+    seconds after the first held item, so a steady stream of images is still written.
+    """
+
+    def __init__(self, on_due, window=0.25, log_callback=None):
+        self.on_due = on_due
+        self.window = window
+        self.log_callback = log_callback
+        self._held = {}  # note path -> held items, oldest first
+        self._deadlines = {}  # note path -> when its held items are written at the latest
+        self._opened = {}  # note path -> when the first held item was added
+        self._due = []  # (deadline, note path key, note path), heap
+        self._changed = threading.Condition()
+        self._thread = None
+
+    def add(self, note_path, item, delay=None, max_age=None):
+        with self._changed:
+            now = time.monotonic()
+            held = self._held.setdefault(note_path, [])
+            held.append(item)
+            if len(held) == 1:
+                self._opened[note_path] = now
+            if len(held) == 1 or delay is not None:
+                deadline = now + (self.window if delay is None else delay)
+                if max_age is not None:
+                    deadline = min(deadline, self._opened[note_path] + max_age)
+                self._deadlines[note_path] = deadline
+                heapq.heappush(self._due, (deadline, str(note_path), note_path))
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='note-writer', daemon=True)
+                    self._thread.start()
+                self._changed.notify()
+
+    def pending(self, note_path):
+        """Items held for the note, oldest first (a copy)."""
+        with self._changed:
+            return list(self._held.get(note_path, ()))
+
+    def take(self, note_path):
+        """Remove and return everything held for the note; the caller writes it."""
+        with self._changed:
+            self._deadlines.pop(note_path, None)
+            self._opened.pop(note_path, None)
+            return self._held.pop(note_path, [])
+
+    def note_paths(self):
+        with self._changed:
+            return list(self._held)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                while not self._due or self._due[0][0] > time.monotonic():
+                    self._changed.wait(self._due[0][0] - time.monotonic() if self._due else None)
+                deadline, _, note_path = heapq.heappop(self._due)
+                if self._deadlines.get(note_path) != deadline:
+                    continue  # already written by the last image of the burst
+            try:
+                self.on_due(note_path)
+            except Exception as e:
+                if self.log_callback:
+                    self.log_callback(f"Held append to {note_path} failed: {e}", "ERROR")
+
+
+class StageTimings:
+    """Count, total and worst duration of each processing stage (file wait, conversion, append, ...)."""
+
+    def __init__(self):
+        self._stats = {}  # stage -> [count, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            stats = self._stats.get(stage)
+            if stats is None:
+                self._stats[stage] = [1, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = max(stats[2], seconds)
+
+    @contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def snapshot(self):
+        """Per stage: count, total, avg and max in seconds."""
+        with self._lock:
+            return {stage: {'count': count, 'total': total, 'avg': total / count, 'max': worst}
+                    for stage, (count, total, worst) in self._stats.items()}
+
+
+class WorkScheduler:
+    """
+    Worker pool shared by every route's ImageHandler, replacing one worker thread per handler.
+
+    Jobs go into one of two lanes chosen by ImageHandler.job_lane: 'fast' for a rename and
+    append (or a small conversion), 'slow' for heavy conversions. Fast workers only serve the
+    fast lane, so a screenshot never waits behind a large TIFF; slow workers serve the slow lane
+    and help with the fast lane when they are idle.
+
+    Handlers serialize their note/rename critical section with key_lock(), so jobs for different
+    notes can still convert in parallel. Each job gets a NoteSequencer ticket when it is queued,
+    which keeps appends to the same note in capture order. Finding the note can mean a vault scan,
+    so submit() only takes the job in: one intake thread resolves note, ticket and lane in capture
+    order, outside the lock, and then hands the job to a lane.
+
+    At most `queue_limit` jobs are held in memory. Beyond that the overload policy applies:
+    'block' makes submit() (the watchdog thread) wait for room, 'spill' appends the path to an
+    on-disk SpillJournal that is fed back as the lanes drain (needs resolve_handler to map a
+    path back to its handler), 'drop_oldest' discards the oldest queued job with a warning.
+    """
+
+    def __init__(self, fast_workers=1, slow_workers=1, log_callback=None, queue_limit=500,
+                 overload_policy='spill', spill_path='.queue_spill.jsonl', resolve_handler=None, metrics=None):
+        self.log_callback = log_callback
+        self.metrics = metrics if metrics is not None else Metrics()  # shared by every handler
+        self.queue_limit = max(1, queue_limit)
+        self.overload_policy = overload_policy if overload_policy in OVERLOAD_POLICIES else 'block'
+        self.resolve_handler = resolve_handler  # path -> ImageHandler (or None), for spilled jobs
+        self.sequencer = NoteSequencer(log_callback)
+        self.retries = RetryQueue(log_callback, metrics=self.metrics)  # shared by every handler on this scheduler
+        self.stage_timings = StageTimings()  # likewise
+        self._journal = SpillJournal(spill_path)
+        self.metrics.add_collector('scheduler', self._collect_metrics)
+        self._lanes = {lane: deque() for lane in LANES}
+        self._stats = {lane: {'done': 0, 'wait_total': 0.0, 'wait_max': 0.0} for lane in LANES}
+        self._pending = set()  # (handler id, path) already queued, to drop duplicate events
+        self._intake = deque()  # (handler or None for spilled paths, path, lane, queued at), awaiting note and lane
+        self._admitting = 0  # intake jobs taken but not yet in a lane
+        self._key_locks = {}
+        self._lock = threading.Lock()
+        self._work_available = threading.Condition(self._lock)
+        self._space_available = threading.Condition(self._lock)
+        self._intake_available = threading.Condition(self._lock)
+        self._stopping = False
+        self._threads = []
+        thread = threading.Thread(target=self._intake_loop, name='scheduler-intake', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        for i in range(max(1, fast_workers)):
+            self._start_worker(f'fast-worker-{i}', ('fast',))
+        for i in range(max(1, slow_workers)):
+            self._start_worker(f'slow-worker-{i}', ('slow', 'fast'))
+
+    def _start_worker(self, name, lanes):
+        thread = threading.Thread(target=self._worker_loop, args=(lanes,), name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def log(self, message, level="INFO"):
+        if self.log_callback:
+            self.log_callback(message, level)
+
+    def submit(self, handler, path, lane=None):
+        """Queue handler.process_image(path). Returns False if the same job is already waiting."""
+        job_id = (id(handler), path)
+        dropped = None
+        with self._lock:
+            if job_id in self._pending:
+                return False
+            spill = self.overload_policy == 'spill' and self.resolve_handler is not None
+            # Once anything is spilled, newer jobs queue behind it on disk to keep capture order
+            if spill and (self._journal.count or self._depth() >= self.queue_limit):
+                self._journal.append(path)
+                self._work_available.notify()
+                return True
+            if self._depth() >= self.queue_limit:
+                if self.overload_policy == 'drop_oldest':
+                    dropped = self._drop_oldest()
+                else:
+                    while self._depth() >= self.queue_limit and not self._stopping:
+                        self._space_available.wait()
+            self._pending.add(job_id)
+            self._intake.append((handler, path, lane, time.monotonic()))
+            self._intake_available.notify()
+        if dropped is not None:
+            # Outside the lock: releasing the ticket can run a parked append, which takes key_lock()
+            dropped_handler, dropped_path, _, dropped_ticket = dropped
+            if dropped_ticket:
+                self.sequencer.release(dropped_ticket)
+            dropped_handler.log(f"Queue full ({self.queue_limit} jobs): dropped oldest image {dropped_path.name}",
+                                "WARNING")
+        return True
+
+    def _depth(self):
+        return sum(len(queue) for queue in self._lanes.values()) + len(self._intake) + self._admitting
+
+    def _drop_oldest(self):
+        """
+        Remove the oldest queued job (under the lock) as (handler, path, queued at, ticket); the
+        caller releases its ticket after unlocking. Jobs still in intake have no ticket yet.
+        """
+        heads = [(self._lanes[lane][0][2], lane) for lane in LANES if self._lanes[lane]]
+        if self._intake and self._intake[0][0] is not None:
+            heads.append((self._intake[0][3], None))
+        if not heads:
+            return None
+        _, lane = min(heads, key=lambda head: head[0])
+        if lane is None:
+            handler, path, _, queued_at = self._intake.popleft()
+            job = (handler, path, queued_at, None)
+        else:
+            job = self._lanes[lane].popleft()
+        self._pending.discard((id(job[0]), job[1]))
+        return job
+
+    def _refill_from_journal(self):
+        """Move spilled paths back into intake once the queue has drained to half the limit."""
+        depth = self._depth()
+        if not self._journal.count or self._stopping or depth > self.queue_limit // 2:
+            return
+        for path in self._journal.pop(self.queue_limit - depth):
+            self._intake.append((None, path, None, time.monotonic()))
+        self._intake_available.notify()
+
+    def _intake_loop(self):
+        """
+        Give intake jobs their lane, note and NoteSequencer ticket, one at a time in capture order.
+        The handler calls (a vault scan, a stat) run without the scheduler lock held.
+        """
+        while True:
+            with self._lock:
+                while not self._intake and not self._stopping:
+                    self._intake_available.wait()
+                if not self._intake:
+                    return
+                handler, path, lane, queued_at = self._intake.popleft()
+                self._admitting += 1
+            ticket = None
+            try:
+                if handler is None:
+                    # Spilled path: find its handler again, unless it is gone or queued meanwhile
+                    handler = self.resolve_handler(path) if self.resolve_handler else None
+                    if handler is not None and path.exists():
+                        with self._lock:
+                            if (id(handler), path) in self._pending:
+                                handler = None
+                            else:
+                                self._pending.add((id(handler), path))
+                    else:
+                        handler = None
+                if handler is not None:
+                    lane = lane or handler.job_lane(path)
+                    note_path = handler.job_note()
+                    ticket = self.sequencer.ticket(note_path) if note_path else None
+            except Exception as e:
+                self.log(f"Could not queue {path.name}: {e}", "ERROR")
+                if handler is not None:
+                    with self._lock:
+                        self._pending.discard((id(handler), path))
+                handler = None
+            with self._lock:
+                self._admitting -= 1
+                if handler is not None:
+                    self._lanes[lane].append((handler, path, queued_at, ticket))
+                # All workers: a fast-only worker cannot take a slow job, and at shutdown idle ones exit
+                self._work_available.notify_all()
+                self._space_available.notify()
+
+    def resume_spilled(self):
+        """Queue jobs spilled by a previous run (call once resolve_handler is set)."""
+        with self._lock:
+            if self._journal.count:
+                self.log(f"Resuming {self._journal.count} spilled job(s) from {self._journal.path}", "INFO")
+            self._refill_from_journal()
+
+    def queue_depth(self):
+        """Jobs waiting per lane, plus those spilled to disk and steps waiting to be retried."""
+        with self._lock:
+            depth = {lane: len(queue) for lane, queue in self._lanes.items()}
+            depth['intake'] = len(self._intake) + self._admitting
+            depth['spilled'] = self._journal.count
+        depth['retrying'] = len(self.retries)
+        return depth
+
+    def key_lock(self, key):
+        """Lock shared by every job touching `key` (a note path, a target folder)."""
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _collect_metrics(self):
+        for queue_name, depth in self.queue_depth().items():
+            yield 'queue_depth', {'queue': queue_name}, depth
+        for stage, stats in self.stage_timings.snapshot().items():
+            yield 'stage_runs_total', {'stage': stage}, stats['count']
+            yield 'stage_seconds_total', {'stage': stage}, stats['total']
+
+    def lane_stats(self):
+        """Per lane: queued jobs, finished jobs, average and worst queue wait in seconds."""
+        with self._lock:
+            return {
+                lane: {
+                    'depth': len(self._lanes[lane]),
+                    'done': stats['done'],
+                    'avg_wait': stats['wait_total'] / stats['done'] if stats['done'] else 0.0,
+                    'max_wait': stats['wait_max'],
+                }
+                for lane, stats in self._stats.items()
+            }
+
+    def _next_job(self, lanes):
+        with self._lock:
+            while True:
+                for lane in lanes:
+                    if self._lanes[lane]:
+                        handler, path, queued_at, ticket = self._lanes[lane].popleft()
+                        self._pending.discard((id(handler), path))
+                        wait = time.monotonic() - queued_at
+                        stats = self._stats[lane]
+                        stats['done'] += 1
+                        stats['wait_total'] += wait
+                        stats['wait_max'] = max(stats['wait_max'], wait)
+                        self._space_available.notify()
+                        self._refill_from_journal()
+                        return lane, handler, path, ticket, wait, len(self._lanes[lane])
+                if self._stopping and not self._intake and not self._admitting:
+                    return None  # anything still spilled stays on disk for the next start
+                self._refill_from_journal()
+                self._work_available.wait()
+
+    def _worker_loop(self, lanes):
+        while True:
+            job = self._next_job(lanes)
+            if job is None:
+                return
+            lane, handler, path, ticket, wait, depth = job
+            handler.log(f"{lane} lane: {path.name} waited {wait:.2f}s ({depth} still queued)", "DEBUG")
+            try:
+                handler.process_image(path, ticket)
+            except Exception as e:
+                handler.log(f"Worker error: {e}", "ERROR")
+                self.metrics.inc('errors_total', stage='process')
+            finally:
+                if ticket:
+                    self.sequencer.release(ticket)
+
+    def shutdown(self):
+        """Let queued jobs finish, then stop the workers (does not block the caller)."""
+        self.metrics.remove_collector('scheduler')
+        with self._lock:
+            self._stopping = True
+            self._work_available.notify_all()
+            self._space_available.notify_all()
+            self._intake_available.notify_all()
+        for lane, stats in self.lane_stats().items():
+            if stats['done']:
+                self.log(f"{lane.capitalize()} lane: {stats['done']} job(s), average wait {stats['avg_wait']:.2f}s, "
+                         f"worst {stats['max_wait']:.2f}s", "INFO")
+        stages = self.stage_timings.snapshot()
+        if stages:
+            self.log("Stages: " + ", ".join(f"{stage} avg {stats['avg'] * 1000:.0f} ms (worst {stats['max'] * 1000:.0f})"
+                                            for stage, stats in stages.items()), "DEBUG")
+        if len(self.retries):
+            self.log(f"{len(self.retries)} step(s) on locked files are still being retried", "INFO")
+
+    def join(self, timeout=None):
+        """Wait up to `timeout` seconds in total for the intake and worker threads to finish (after shutdown)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0, deadline - time.monotonic()))
+        return not any(thread.is_alive() for thread in self._threads)